@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Capture Module
+        ftp.capture
+
+    Written By:
+        Shane Hutter
+
+        A module for capturing the MIDI recieved from a Tripleplay to a binary file,
+        and replaying it through ftposcd without a Tripleplay connected.
+
+        A capture file is a CAPTURE_HEADER, followed by fixed size CAPTURE_RECORDs,
+        appended as MIDI messages are recieved:
+            timestamp   perf_counter_ns() when the message was recieved, signed 64 bit
+            length      number of MIDI bytes
+            data        the MIDI bytes of the message, zero padded
+
+        Messages longer than CAPTURE_MIDI_BYTES (long SysEx) are not captured, and are
+        counted as skipped.
+
+        Each start of ftposcd appends its session to the same file, once its header
+        is checked.  Replay waits at most REPLAY_GAP_LIMIT between two records, so the
+        time ftposcd was stopped between sessions is not replayed.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from .midi  import ftp_pickup_index
+from mmap   import (
+        mmap    , ACCESS_READ   ,
+        )
+from struct import Struct
+from time   import (
+        perf_counter_ns , sleep ,
+        )
+
+
+CAPTURE_MAGIC       = b"FTPCAPT\0"
+CAPTURE_VERSION     = 1
+CAPTURE_MIDI_BYTES  = 7
+CAPTURE_HEADER      = Struct( "<8sII" )     # magic, version, record size
+CAPTURE_RECORD      = Struct(
+        "<qB{}s".format( CAPTURE_MIDI_BYTES )
+        )
+CAPTURE_INDICES     = {
+        "timestamp" : 0 ,
+        "length"    : 1 ,
+        "data"      : 2 ,
+        }
+
+NANOSECONDS_PER_SECOND  = 1000000000
+REPLAY_SPEED            = 1.0   # 0 replays as fast as possible
+REPLAY_GAP_LIMIT        = 2 * NANOSECONDS_PER_SECOND    # longest wait between two records
+
+capture_invalid = "{path} is not a version {version} capture file"
+replay_report   = "replayed {count} messages in {seconds:.3f}s, {rate:.0f} messages/s"
+
+
+
+def capture_path(
+        path        ,
+        midi_pickup ,
+        ):
+    """
+        Return the capture file of a Tripleplay.  The first Tripleplay captures to
+        path, every other to path followed by its pickup name.
+    """
+    if not ftp_pickup_index( midi_pickup ):
+        return path
+    return "{path}.{midi_pickup}".format(
+            path        = path          ,
+            midi_pickup = midi_pickup   ,
+            )
+
+
+
+class MIDICapture:
+    """
+        Append recieved MIDI messages to a capture file.
+
+        Records are packed into one preallocated buffer, and written through the
+        file's buffer, so capturing a message costs a pack and a buffered write.
+    """
+
+    def __init__( self , path ):
+        """
+            Open the capture file for appending, writing the header to a new file.
+
+            An existing file must have the header of this version, or ValueError is
+            raised, and nothing is appended to it.  A partly written last record,
+            from a session which was killed, is cut off.
+        """
+        self.path           = path
+        self.capture_file   = open( path , "ab" )
+        self.record_buffer  = bytearray( CAPTURE_RECORD.size )
+        self.captured       = ZERO
+        self.skipped        = ZERO
+        size    = self.capture_file.tell()
+        if not size:
+            self.capture_file.write(
+                    CAPTURE_HEADER.pack(
+                        CAPTURE_MAGIC           ,
+                        CAPTURE_VERSION         ,
+                        CAPTURE_RECORD.size     ,
+                        )
+                    )
+            return
+        with open( path , "rb" ) as capture_file:
+            header  = capture_file.read( CAPTURE_HEADER.size )
+        if len( header ) < CAPTURE_HEADER.size or CAPTURE_HEADER.unpack( header ) != (
+                CAPTURE_MAGIC           ,
+                CAPTURE_VERSION         ,
+                CAPTURE_RECORD.size     ,
+                ):
+            self.capture_file.close()
+            raise ValueError(
+                    capture_invalid.format(
+                        path    = path              ,
+                        version = CAPTURE_VERSION   ,
+                        )
+                    )
+        self.capture_file.truncate(
+                size - ( size - CAPTURE_HEADER.size ) % CAPTURE_RECORD.size
+                )
+
+
+    def record(
+            self        ,
+            midi_data   ,
+            received_ns ,
+            ):
+        """
+            Append a list of MIDI bytes, and the perf_counter_ns() timestamp taken when
+            it was recieved.
+        """
+        if len( midi_data ) > CAPTURE_MIDI_BYTES:
+            self.skipped    += ONE
+            return
+        CAPTURE_RECORD.pack_into(
+                self.record_buffer      ,
+                ZERO                    ,
+                received_ns             ,
+                len( midi_data )        ,
+                bytes( midi_data )      ,
+                )
+        self.capture_file.write( self.record_buffer )
+        self.captured   += ONE
+
+
+    def close( self ):
+        """
+            Flush, and close, the capture file
+        """
+        self.capture_file.close()
+
+
+
+class CaptureReplay:
+    """
+        Replay a capture file as a MIDI input, with the receive(), poll() and
+        iter_pending() methods of FTPDeviceManager, so ftposcd's MIDI input loops,
+        and everything after them, run on it as they do on a Tripleplay.
+
+        The file is memory mapped, and records are unpacked as they are due.  speed
+        scales the time between records, 2 replays twice as fast, and 0 replays as
+        fast as possible.  No wait between two records is longer than
+        REPLAY_GAP_LIMIT, or shorter than none, so the gaps between the sessions of a
+        capture file, or a clock reset by a reboot, are skipped.  Once every record has
+        been replayed, receive(), poll() and iter_pending() raise EOFError.
+    """
+
+    def __init__(
+            self                    ,
+            path                    ,
+            speed   = REPLAY_SPEED  ,
+            ):
+        """
+            Map the capture file, and check its header
+        """
+        self.path           = path
+        self.speed          = speed
+        self.capture_file   = open( path , "rb" )
+        self.records        = mmap(
+                self.capture_file.fileno()  ,
+                ZERO                        ,
+                access  = ACCESS_READ       ,
+                )
+        magic , version , record_size   = CAPTURE_HEADER.unpack_from( self.records )
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION or record_size != CAPTURE_RECORD.size:
+            self.close()
+            raise ValueError(
+                    capture_invalid.format(
+                        path    = path              ,
+                        version = CAPTURE_VERSION   ,
+                        )
+                    )
+        # A partly written last record is ignored
+        self.count      = ( len( self.records ) - CAPTURE_HEADER.size ) // CAPTURE_RECORD.size
+        self.index      = ZERO
+        self.connects   = ONE
+        self.start_ns   = None
+        self.last_ns    = None      # timestamp of the record last due
+        self.due_index  = None
+        self.next_due_ns    = None
+
+
+    def __enter__( self ):
+        return self
+
+
+    def __exit__(
+            self        ,
+            *exception  ,
+            ):
+        return self.close()
+
+
+    def close( self ):
+        """
+            Unmap, and close, the capture file
+        """
+        self.records.close()
+        self.capture_file.close()
+
+
+    def due_ns( self , index ):
+        """
+            Return the perf_counter_ns() at which a record is due to be replayed.
+            Records are due in order, each the limited gap after the one before.
+        """
+        if index == self.due_index:
+            return self.next_due_ns
+        timestamp   = CAPTURE_RECORD.unpack_from(
+                self.records                                            ,
+                CAPTURE_HEADER.size + index * CAPTURE_RECORD.size       ,
+                )[ CAPTURE_INDICES[ "timestamp" ] ]
+        if self.start_ns is None:
+            self.start_ns       = perf_counter_ns()
+            self.next_due_ns    = self.start_ns
+        elif self.speed:
+            gap_ns  = min(
+                    max(
+                        timestamp - self.last_ns    ,
+                        ZERO                        ,
+                        )                           ,
+                    REPLAY_GAP_LIMIT                ,
+                    )
+            self.next_due_ns    += int( gap_ns / self.speed )
+        self.last_ns    = timestamp
+        self.due_index  = index
+        return self.next_due_ns
+
+
+    def message( self ):
+        """
+            Unpack the next record as a list of MIDI bytes, and the perf_counter_ns() it
+            was replayed, as the MIDI input hands on
+        """
+        timestamp , length , data   = CAPTURE_RECORD.unpack_from(
+                self.records                                            ,
+                CAPTURE_HEADER.size + self.index * CAPTURE_RECORD.size  ,
+                )
+        self.index  += ONE
+        return (
+                list( data[ : length ] )    ,
+                perf_counter_ns()           ,
+                )
+
+
+    def receive( self ):
+        """
+            Wait until the next record is due, and return it
+        """
+        if self.index >= self.count:
+            raise EOFError( self.path )
+        wait_ns = self.due_ns( self.index ) - perf_counter_ns()
+        if wait_ns > ZERO:
+            sleep( wait_ns / NANOSECONDS_PER_SECOND )
+        return self.message()
+
+
+    def poll( self ):
+        """
+            Return the next record if it is due, or None
+        """
+        if self.index >= self.count:
+            raise EOFError( self.path )
+        if self.due_ns( self.index ) > perf_counter_ns():
+            return None
+        return self.message()
+
+
+    def iter_pending( self ):
+        """
+            Iterate through the records which are due
+        """
+        while True:
+            message = self.poll()
+            if message is None:
+                return
+            yield message
+
+
+    def report( self ):
+        """
+            Return a one line report of the replay rate
+        """
+        seconds = ( perf_counter_ns() - ( self.start_ns or perf_counter_ns() ) ) / NANOSECONDS_PER_SECOND
+        return replay_report.format(
+                count   = self.index                            ,
+                seconds = seconds                               ,
+                rate    = self.index / seconds if seconds else float( ZERO ) ,
+                )
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Coalesce Module
+        ftp.coalesce
+
+    Written By:
+        Shane Hutter
+
+        A module for coalescing the continuous pitchwheel and control change streams
+        the Tripleplay sends in mono mode, so only the newest value per channel is sent
+        as OSC within each interval.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from .midi  import (
+        MIDI_BYTES_INDICES      , MIDI_CONTROL_STATUS   , MIDI_PITCHWHEEL_STATUS    ,
+        MIDI_STATUS_INDEX       ,
+        )
+from time   import perf_counter_ns
+
+
+NANOSECONDS_PER_MICRO   = 1000
+NANOSECONDS_PER_SECOND  = 1000000000
+MIDI_CONTROL_INDEX      = MIDI_BYTES_INDICES[ "note" ]
+MIDI_KEY_SHIFT          = 8
+
+# Continuous controllers.  Switches, such as sustain, and channel mode messages are
+#   never coalesced, as their on and off within one interval would be lost.
+MIDI_COALESCE_CONTROLS  = range( 0 , 64 )
+
+coalesce_report = "{midi_pickup}: coalesced {coalesced} of {received} messages, {ratio:.2f}x fewer sent"
+
+
+
+class MIDICoalescer:
+    """
+        Keep only the newest pitchwheel per channel, and the newest continuous control
+        change per channel and controller, for interval microseconds, then hand them to
+        osc_handler.
+
+        Every other message, such as note on and off, and program change, is handed to
+        osc_handler at once.  Any pending values are handed over just before it, so
+        nothing is reordered around a note, and no note is ever dropped.
+
+        Pending values are handed over in the order of their newest value.
+    """
+
+    def __init__(
+            self        ,
+            osc_handler ,
+            interval    ,
+            ):
+        """
+            osc_handler is called with the MIDI bytes and received timestamp of every
+            message sent on.  interval is in microseconds.
+        """
+        self.osc_handler    = osc_handler
+        self.interval_ns    = interval * NANOSECONDS_PER_MICRO
+        self.pending        = dict()
+        self.deadline_ns    = ZERO
+        self.received       = ZERO
+        self.coalesced      = ZERO
+
+
+    def add(
+            self        ,
+            midi_data   ,
+            received_ns ,
+            ):
+        """
+            Coalesce a pitchwheel or continuous control change, or hand any other
+            message on, after the pending values.
+        """
+        self.received   += ONE
+        status  = midi_data[ MIDI_STATUS_INDEX ]
+        if status in MIDI_PITCHWHEEL_STATUS:
+            key = status
+        elif status in MIDI_CONTROL_STATUS and midi_data[
+                MIDI_CONTROL_INDEX
+                ] in MIDI_COALESCE_CONTROLS:
+            key = ( status << MIDI_KEY_SHIFT ) | midi_data[ MIDI_CONTROL_INDEX ]
+        else:
+            if self.pending:
+                self.flush()
+            self.osc_handler(
+                    midi_data   ,
+                    received_ns ,
+                    )
+            return
+
+        if not self.pending:
+            self.deadline_ns    = perf_counter_ns() + self.interval_ns
+        elif self.pending.pop( key , None ):
+            self.coalesced  += ONE
+        self.pending[ key ] = (
+                midi_data   ,
+                received_ns ,
+                )
+
+
+    def timeout( self ):
+        """
+            Return the seconds until the pending values are due, or None if there are
+            none, for waiting on the MIDI input.
+        """
+        if not self.pending:
+            return None
+        return max(
+                self.deadline_ns - perf_counter_ns()    ,
+                ZERO                                    ,
+                ) / NANOSECONDS_PER_SECOND
+
+
+    def flush_due( self ):
+        """
+            Hand the pending values on, if the interval has ended
+        """
+        if self.pending and perf_counter_ns() >= self.deadline_ns:
+            self.flush()
+
+
+    def flush( self ):
+        """
+            Hand every pending value on
+        """
+        pending         = self.pending
+        self.pending    = dict()
+        for midi_data , received_ns in pending.values():
+            self.osc_handler(
+                    midi_data   ,
+                    received_ns ,
+                    )
+
+
+    def ratio( self ):
+        """
+            Return how many messages were received per message sent on
+        """
+        sent    = self.received - self.coalesced
+        if not sent:
+            return float( ONE )
+        return self.received / sent
+
+
+    def report( self , midi_pickup ):
+        """
+            Return a one line report of the reduction
+        """
+        return coalesce_report.format(
+                midi_pickup = midi_pickup       ,
+                coalesced   = self.coalesced    ,
+                received    = self.received     ,
+                ratio       = self.ratio()      ,
+                )
@@ -11,10 +11,14 @@ Fishman Tripleplay MIDI to OSC converter
 """
 
 from .  import (
-        ZERO    ,
+        ZERO    , ONE   ,
         REGEX   ,
         )
-from re import match
+from .transport  import (
+        osc_url , OSC_TRANSPORTS    , OSC_URL_SEPARATOR ,
+        )
+from re     import match
+from sys    import stderr
 
 
 # CONSTANTS
@@ -25,52 +29,169 @@ CONFIG  = {
         "dir"       : "/etc"            ,
         "file"      : "ftposcd.conf"    ,
         "comment"   : "#"               ,
+        "target-separator"  : ","       ,
         "INDEX"     : {
             "non-comment"   : ZERO  ,
             }                           ,
         }
 
+# Why a line of the configuration file was skipped
+CONFIG_INVALID  = {
+        "unreadable"    : "expected a property and a value" ,
+        "unknown"       : "unknown property"                ,
+        "not a number"  : "value is not a number"           ,
+        }
+
+config_invalid  = "{path}:{line_number}: {reason}: {line}"
+
+# Defaults, also the type of each property
 config_data = {
         "remote-osc-host"   : str() ,
         "remote-osc-port"   : int() ,
+        "remote-osc-targets"    : str() ,
         "local-osc-port"    : int() ,
         "ftposc2midi-port"  : int() ,
+        "ftposc2midi-url"   : str() ,
+        "ftposc2midi-shm"   : str() ,
+        "ftposc2midi-channel"   : int() ,
+        "midi-input-mode"   : "event"   ,
+        "midi-input-backend"    : "rtmidi"  ,
+        "osc-bundle-size"   : int() ,
+        "osc-bundle-window" : int() ,
+        "osc-sender"        : "liblo"   ,
+        "osc-sndbuf"        : int() ,
+        "device-poll-interval"  : int() ,
+        "ftp-devices"       : int() ,
+        "osc-ring-size"     : int() ,
+        "osc-ring-overflow" : "drop-oldest" ,
+        "coalesce-interval" : int() ,
+        "metrics-port"      : int() ,
+        "ftposc2midi-metrics-port"  : int() ,
+        "profile"           : int() ,
+        "profile-sample"    : int() ,
+        "profile-dir"       : "/tmp"    ,
+        "capture-file"      : str() ,
+        "realtime-priority" : int() ,
+        "realtime-cpus"     : str() ,
+        "realtime-mlock"    : int() ,
+        "gc-freeze"         : int() ,
+        "gc-idle-interval"  : int() ,
         }
 
 
 
-def load_config():
-    """
-        Load data out of the configuration file
+def read_config(
+        config_path = None  ,
+        ):
     """
+        Read the configuration file, without changing anything.
 
-    with open( 
-            "{dir}/{file}".format( **CONFIG )   , "r"   ,
+        Return a new dictionary of the defaults in config_data, updated with the
+        configuration file, and a list of the invalid lines, which are skipped:
+            unreadable lines, which are not a property and a value
+            unknown properties
+            properties which take a number, with a value which is not
+    """
+    config_path     = config_path or "{dir}/{file}".format( **CONFIG )
+    loaded_data     = dict( config_data )
+    invalid_lines   = list()
+    with open(
+            config_path , "r"   ,
             ) as config_file:
-        config_lines    = list()
-        for line in config_file.read().split( "\n" ):
+        for line_number , line in enumerate(
+                config_file.read().split( "\n" )   ,
+                ONE                                 ,
+                ):
             line_data = line.split(
                     CONFIG[ "comment" ]
                     )[
                             CONFIG[ "INDEX" ][ "non-comment" ]
                             ]
-            if line_data:
-                # Attempt to read the property and value from the line
-                try:
-                    config_property , config_value  = line_data.split()
-                except:
-                    # Ignore unreadable lines (better to error log)
-                    pass
-                
-                if config_property in config_data:
-                    # Store the value in the data dictionary, only if already present
-                    if match( 
+            if not line_data.strip():
+                continue
+
+            # Read the property and value from the line
+            invalid = None
+            try:
+                config_property , config_value  = line_data.split()
+            except ValueError:
+                invalid = CONFIG_INVALID[ "unreadable" ]
+            else:
+                if config_property not in config_data:
+                    invalid = CONFIG_INVALID[ "unknown" ]
+                elif isinstance( config_data[ config_property ] , int ):
+                    # Numeric properties only take numbers
+                    if match(
                             REGEX[ "only-numbers" ] ,
                             config_value            ,
                             ):
-                        # Convert value to integer, because it is only numeric
                         config_value    = int( config_value )
-                    config_data.update( 
-                            { config_property : config_value }
+                    else:
+                        invalid = CONFIG_INVALID[ "not a number" ]
+            if invalid:
+                invalid_lines.append(
+                        config_invalid.format(
+                            path        = config_path   ,
+                            line_number = line_number   ,
+                            reason      = invalid       ,
+                            line        = line.strip()  ,
                             )
-    return config_data
+                        )
+                continue
+
+            loaded_data.update(
+                    { config_property : config_value }
+                    )
+    return loaded_data , invalid_lines
+
+
+def load_config():
+    """
+        Load data out of the configuration file, reporting any invalid lines
+    """
+    loaded_data , invalid_lines = read_config()
+    for invalid in invalid_lines:
+        print(
+                invalid         ,
+                file = stderr   ,
+                )
+    return loaded_data
+
+
+def osc_targets( config_data ):
+    """
+        Return a list of ( host , port , transport ) OSC targets.
+
+        remote-osc-host and remote-osc-port are the first target, followed by every
+        host:port in the comma separated remote-osc-targets.  Duplicates are skipped.
+
+        remote-osc-host, and every target, may instead be a udp://, unix://, or tcp://
+        URL, as parsed by osc_url().  A URL without a port uses remote-osc-port.
+    """
+    targets = list()
+    if config_data[ "remote-osc-host" ]:
+        if OSC_URL_SEPARATOR in config_data[ "remote-osc-host" ]:
+            targets.append(
+                    osc_url(
+                        config_data[ "remote-osc-host" ]    ,
+                        config_data[ "remote-osc-port" ]    ,
+                        )
+                    )
+        else:
+            targets.append(
+                    (
+                        config_data[ "remote-osc-host" ]    ,
+                        config_data[ "remote-osc-port" ]    ,
+                        OSC_TRANSPORTS[ "udp" ]             ,
+                        )
+                    )
+    for target in str( config_data[ "remote-osc-targets" ] ).split( CONFIG[ "target-separator" ] ):
+        if not target:
+            continue
+        target  = osc_url(
+                target                              ,
+                config_data[ "remote-osc-port" ]    ,
+                )
+        if target not in targets:
+            targets.append( target )
+    return targets
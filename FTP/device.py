@@ -0,0 +1,374 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Device Module
+        ftp.device
+
+    Written By:
+        Shane Hutter
+
+        A module for finding the Fishman TriplePlay pickups, and reconnecting to them
+        when they are turned off and back on at the pickup.
+
+        MIDI input backends, set by midi-input-backend:
+            rtmidi  an rtmidi.MidiIn callback, queueing the list of MIDI bytes rtmidi
+                    passes it, with no mido Message built per event (default)
+            mido    a mido input callback, queueing message.bytes()
+
+        Both callbacks queue the MIDI bytes with the perf_counter_ns() they were
+        recieved, taken on the callback's thread, so the latency ftposcd records
+        starts before the queue, in either input mode.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from .midi  import (
+        ftp_control_output  , ftp_inputs    ,
+        FTP_FIRST_DEVICE_INDEX  ,
+        )
+from .realtime  import realtime_thread
+from mido       import open_input
+from queue      import (
+        Empty   , SimpleQueue   ,
+        )
+from rtmidi     import (
+        MidiIn  , RtMidiError   ,
+        )
+from threading  import (
+        Event   , Thread    ,
+        )
+from time       import perf_counter_ns
+
+
+MILLISECONDS            = 1000
+DEVICE_POLL_INTERVAL    = 250   # milliseconds
+DEVICE_RETRY_INTERVAL   = 25    # milliseconds, doubled up to the poll interval
+DEVICE_RETRY_BACKOFF    = 2
+
+MIDI_INPUT_BACKENDS = {
+        "rtmidi"    : "rtmidi"  ,
+        "mido"      : "mido"    ,
+        }
+
+# rtmidi callback events are ( message , delta time , )
+MIDI_EVENT_INDICES  = {
+        "message"       : 0 ,
+        "delta time"    : 1 ,
+        }
+
+device_connected    = "Connected to {name}"
+device_disconnected = "Disconnected from {name}"
+
+
+
+def ftp_device_indices( ftp_devices = ZERO ):
+    """
+        Return the device indices of the Tripleplays to serve.
+
+        ftp_devices is the number of pickups, 0 serves every pickup connected now.
+        At least the first pickup is always served, so ftposcd waits for it to be
+        turned on.
+    """
+    if not ftp_devices:
+        ftp_devices = len( ftp_inputs() )
+    return range(
+            FTP_FIRST_DEVICE_INDEX      ,
+            max( ftp_devices , ONE )    ,
+            )
+
+
+
+class RawMIDIInput:
+    """
+        A MIDI input opened directly with rtmidi, calling callback with a tuple of the
+        list of MIDI bytes of each message, and the perf_counter_ns() it was recieved.
+
+        rtmidi calls receive() from its own thread with ( message , delta time , ).
+        The delta time is dropped, the message is timestamped as it is handed on, so
+        its latency includes the queue ftposcd takes it from.  System exclusive and
+        timing messages are passed, as mido passes them, active sensing is ignored.
+
+        With a priority, the rtmidi thread schedules itself with SCHED_FIFO at it, on
+        the first event, as rtmidi starts the thread when the port is opened.
+    """
+
+    def __init__(
+            self                ,
+            input_name          ,
+            callback            ,
+            priority    = ZERO  ,
+            ):
+        """
+            Open input_name, raising OSError if it is not a MIDI input
+        """
+        self.name       = input_name
+        self.callback   = callback
+        self.priority   = priority
+        self.midi_in    = MidiIn()
+        try:
+            port_index  = self.midi_in.get_ports().index( input_name )
+        except ValueError:
+            self.midi_in.delete()
+            raise OSError(
+                    "unknown port {!r}".format( input_name )
+                    )
+        self.midi_in.open_port( port_index )
+        self.midi_in.ignore_types(
+                sysex           = False ,
+                timing          = False ,
+                active_sense    = True  ,
+                )
+        self.midi_in.set_callback( self.receive )
+
+
+    def receive(
+            self            ,
+            event           ,
+            data    = None  ,
+            ):
+        """
+            Hand the MIDI bytes of an rtmidi event to the callback
+        """
+        if self.priority:
+            realtime_thread( self.priority )
+            self.priority   = ZERO
+        self.callback(
+                (
+                    event[ MIDI_EVENT_INDICES[ "message" ] ]    ,
+                    perf_counter_ns()                           ,
+                    )
+                )
+
+
+    def close( self ):
+        """
+            Close the MIDI input
+        """
+        self.midi_in.cancel_callback()
+        self.midi_in.close_port()
+        self.midi_in.delete()
+
+
+
+class FTPDeviceManager:
+    """
+        Keep a MIDI input open to a Fishman TriplePlay, reopening it when the pickup
+        is turned off and on again.
+
+        The Tripleplay port list is cached, and refreshed by a watcher thread.  While
+        connected, the port list is checked every poll_interval milliseconds.  While
+        disconnected, it is checked after DEVICE_RETRY_INTERVAL milliseconds, backing
+        off up to poll_interval, so a power cycled pickup is back well under a second.
+        ALSA gives the pickup a new port name when it comes back, so the input is matched
+        by FTP_MIDI_NAME, not by the name it had before.
+
+        The MIDI bytes of messages from whichever port is open are put on one queue,
+        with either backend, and the manager has the receive(), poll() and
+        iter_pending() methods of a mido input, so the MIDI input loops keep waiting
+        on the manager across reconnects.
+
+        The shared control output is closed and reopened along with the input.
+        connected is set while the input is open.
+    """
+
+    def __init__(
+            self                                            ,
+            device_index    = FTP_FIRST_DEVICE_INDEX        ,
+            poll_interval   = DEVICE_POLL_INTERVAL          ,
+            control_output  = ftp_control_output            ,
+            backend         = MIDI_INPUT_BACKENDS[ "rtmidi" ]   ,
+            realtime_priority   = ZERO                      ,
+            ):
+        """
+            device_index is the index of the Tripleplay in ftp_inputs()
+            poll_interval is in milliseconds
+            backend is one of MIDI_INPUT_BACKENDS
+            realtime_priority is the SCHED_FIFO priority of the thread each opened
+                input recieves MIDI on, 0 leaves it as it is
+        """
+        self.device_index   = device_index
+        self.poll_interval  = ( poll_interval or DEVICE_POLL_INTERVAL ) / MILLISECONDS
+        self.control_output = control_output
+        self.backend        = backend
+        self.realtime_priority  = realtime_priority
+        self.callback_priority  = ZERO
+        self.queue          = SimpleQueue()
+        self.input_names    = tuple()
+        self.input_name     = None
+        self.midi_in        = None
+        self.connects       = ZERO
+        self.connected      = Event()
+        self.stopped        = Event()
+        self.watcher        = Thread(
+                target  = self.watch    ,
+                daemon  = True          ,
+                )
+
+
+    def __enter__( self ):
+        """
+            Connect to the Tripleplay, if it is present, and start watching for it
+        """
+        self.refresh()
+        self.watcher.start()
+        return self
+
+
+    def __exit__(
+            self        ,
+            *exception  ,
+            ):
+        """
+            Stop watching, and close the MIDI input
+        """
+        return self.close()
+
+
+    def close( self ):
+        """
+            Stop watching, and close the MIDI input
+        """
+        self.stopped.set()
+        if self.watcher.is_alive():
+            self.watcher.join()
+        self.disconnect()
+
+
+    def refresh( self ):
+        """
+            Rescan the Tripleplay ports, and reconnect if the input has changed.
+
+            Return True if connected.
+        """
+        self.input_names    = tuple( ftp_inputs() )
+        if self.device_index < len( self.input_names ):
+            input_name  = self.input_names[ self.device_index ]
+        else:
+            input_name  = None
+
+        if input_name != self.input_name:
+            self.disconnect()
+            if input_name:
+                self.connect( input_name )
+        return bool( self.midi_in )
+
+
+    def connect( self , input_name ):
+        """
+            Open the MIDI input, delivering the bytes of its messages to the queue
+        """
+        try:
+            if self.backend == MIDI_INPUT_BACKENDS[ "mido" ]:
+                # A new port recieves on a new thread
+                self.callback_priority  = self.realtime_priority
+                self.midi_in    = open_input(
+                        input_name                          ,
+                        callback    = self.mido_receive     ,
+                        )
+            else:
+                self.midi_in    = RawMIDIInput(
+                        input_name                          ,
+                        self.queue.put                      ,
+                        self.realtime_priority              ,
+                        )
+        except ( OSError , RtMidiError ):
+            # The port went away again while opening, retry on the next refresh
+            self.midi_in    = None
+            return
+        self.input_name = input_name
+        self.connects   += ONE
+        self.control_output.close()
+        self.control_output.connect()
+        self.connected.set()
+        print(
+                device_connected.format( name = input_name )
+                )
+
+
+    def mido_receive( self , message ):
+        """
+            Queue the bytes of a message from the mido backend, and when it was recieved
+        """
+        received_ns = perf_counter_ns()
+        if self.callback_priority:
+            realtime_thread( self.callback_priority )
+            self.callback_priority  = ZERO
+        self.queue.put(
+                (
+                    message.bytes() ,
+                    received_ns     ,
+                    )
+                )
+
+
+    def disconnect( self ):
+        """
+            Close the MIDI input, and the control output
+        """
+        if self.midi_in:
+            try:
+                self.midi_in.close()
+            except ( OSError , RtMidiError ):
+                pass
+            print(
+                    device_disconnected.format( name = self.input_name )
+                    )
+            self.control_output.close()
+        self.connected.clear()
+        self.midi_in    = None
+        self.input_name = None
+
+
+    def watch( self ):
+        """
+            Refresh the port list until closed, backing off while disconnected
+        """
+        interval    = self.poll_interval
+        retrying    = False
+        while not self.stopped.wait( interval ):
+            try:
+                connected   = self.refresh()
+            except ( OSError , RtMidiError ):
+                connected   = False
+            if connected:
+                interval    = self.poll_interval
+                retrying    = False
+            elif not retrying:
+                interval    = DEVICE_RETRY_INTERVAL / MILLISECONDS
+                retrying    = True
+            else:
+                interval    = min(
+                        interval * DEVICE_RETRY_BACKOFF ,
+                        self.poll_interval              ,
+                        )
+
+
+    def receive( self ):
+        """
+            Block until a MIDI message arrives, and return its ( MIDI bytes ,
+            perf_counter_ns() it was recieved , )
+        """
+        return self.queue.get()
+
+
+    def poll( self ):
+        """
+            Return the ( MIDI bytes , received_ns , ) of the next pending MIDI message,
+            or None
+        """
+        try:
+            return self.queue.get_nowait()
+        except Empty:
+            return None
+
+
+    def iter_pending( self ):
+        """
+            Iterate through pending MIDI messages
+        """
+        while True:
+            message = self.poll()
+            if message is None:
+                return
+            yield message
@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Engine Module
+        ftp.engine
+
+    Written By:
+        Shane Hutter
+
+        A module for the MIDI input loops which feed recieved MIDI messages
+        into a handler, to be converted and sent out as OSC, and the OSC send stage
+        which takes them from a MIDIRing filled by the input loop.
+"""
+
+from .      import (
+        LATENCY , ZERO  ,
+        )
+from time   import (
+        perf_counter_ns , sleep ,
+        )
+
+
+NANOSECONDS_PER_MICRO   = 1000
+
+# Input modes
+MIDI_INPUT_MODE = {
+        "event" : "event"   ,
+        "poll"  : "poll"    ,
+        }
+
+
+class OSCBatch:
+    """
+        Gather MIDI messages, and send them through the OSC sender as one OSC bundle.
+
+        A batch is flushed when it holds osc_bundle_size messages, or by the input
+        loop once no more MIDI messages are pending and osc_bundle_window microseconds
+        have passed since the first message was added.  A window of 0 sends everything
+        drained from the MIDI input in one pass as one bundle.
+    """
+
+    def __init__(
+            self                ,
+            osc_sender          ,
+            osc_bundle_size     ,
+            osc_bundle_window   ,
+            metrics     = None  ,
+            ):
+        """
+            Initialize the batch.  metrics is an optional FTPMetrics, each message is
+            recorded when the bundle containing it is sent.
+        """
+        self.osc_sender = osc_sender
+        self.size       = osc_bundle_size
+        self.window_ns  = osc_bundle_window * NANOSECONDS_PER_MICRO
+        self.metrics    = metrics
+        self.messages   = list()
+        self.received   = list()
+        self.opened_ns  = ZERO
+
+
+    def add(
+            self        ,
+            midi_data   ,
+            received_ns ,
+            ):
+        """
+            Add a list of MIDI bytes to the batch, flushing it once it is full.
+        """
+        if not self.messages:
+            self.opened_ns  = perf_counter_ns()
+        self.messages.append( midi_data )
+        self.received.append( received_ns )
+        if len( self.messages ) >= self.size:
+            self.flush()
+
+
+    def waiting( self ):
+        """
+            Return True while the batch holds messages, and its window is still open.
+        """
+        return bool( self.messages ) and perf_counter_ns() - self.opened_ns < self.window_ns
+
+
+    def flush( self ):
+        """
+            Send the batch as one OSC bundle.
+        """
+        if not self.messages:
+            return
+        self.osc_sender.send_bundle( self.messages )
+        if self.metrics:
+            for midi_data , received_ns in zip( self.messages , self.received ):
+                self.metrics.record(
+                        midi_data   ,
+                        received_ns ,
+                        )
+        self.messages.clear()
+        self.received.clear()
+
+
+def event_midi_input(
+        midi_in             ,
+        midi_handler        ,
+        osc_batch   = None  ,
+        ):
+    """
+        Block on the MIDI input, and handle each message as soon as it arrives.
+
+        midi_handler is called with the list of MIDI bytes of the message, and the
+        perf_counter_ns() timestamp taken by the MIDI input's callback when the message
+        was recieved, so the latency includes the handoff through its queue.
+
+        With an OSCBatch, every message already pending is drained after the first one
+        arrives, and the input is spun on until the batch window closes, before the
+        batch is flushed.
+    """
+    while True:
+        midi_handler( *midi_in.receive() )
+        if osc_batch:
+            for message in midi_in.iter_pending():
+                midi_handler( *message )
+            while osc_batch.waiting():
+                message = midi_in.poll()
+                if message:
+                    midi_handler( *message )
+            osc_batch.flush()
+
+
+def poll_midi_input(
+        midi_in             ,
+        midi_handler        ,
+        osc_batch   = None  ,
+        ):
+    """
+        Poll the MIDI input for pending messages, sleeping for LATENCY between polls.
+
+        This is the fallback for MIDI backends which can not block on receive.
+
+        midi_handler is passed the timestamp taken by the MIDI input's callback, as in
+        event mode, so the recorded latency includes the time spent waiting to be
+        polled, and the two modes are measured from the same point.
+
+        With an OSCBatch, the batch is flushed after a poll once its window has closed.
+    """
+    while True:
+        for message in midi_in.iter_pending():
+            midi_handler( *message )
+        if osc_batch and not osc_batch.waiting():
+            osc_batch.flush()
+
+        # Sleep for latency
+        '''
+            reduce cpu with unrestrained looping
+        '''
+        sleep( LATENCY )
+
+
+def ring_osc_output(
+        midi_ring           ,
+        osc_handler         ,
+        osc_batch   = None  ,
+        coalescer   = None  ,
+        ):
+    """
+        The OSC send stage.  Take MIDI messages from a MIDIRing, filled by the MIDI
+        receive stage, and hand them to osc_handler until the ring is closed.
+
+        osc_handler is called with the MIDI bytes, and the perf_counter_ns() timestamp
+        taken when the message was recieved by the receive stage.
+
+        With an OSCBatch, every message already in the ring is drained after the first
+        one, and the ring is spun on until the batch window closes, before the batch
+        is flushed.
+
+        With a MIDICoalescer, osc_handler should add to it.  The ring is only waited on
+        until the coalescer's interval ends, so its pending values are sent on time.
+    """
+    timeout = None
+    while True:
+        if coalescer:
+            timeout = coalescer.timeout()
+        message = midi_ring.get( timeout )
+        if message is None:
+            if midi_ring.closed:
+                break
+        else:
+            osc_handler( *message )
+            if osc_batch:
+                for message in midi_ring.iter_pending():
+                    osc_handler( *message )
+                while osc_batch.waiting():
+                    message = midi_ring.poll()
+                    if message:
+                        osc_handler( *message )
+        if coalescer:
+            coalescer.flush_due()
+        if osc_batch:
+            osc_batch.flush()
+    if coalescer:
+        coalescer.flush()
+    if osc_batch:
+        osc_batch.flush()
+
+
+MIDI_INPUT_LOOPS    = {
+        MIDI_INPUT_MODE[ "event" ]  : event_midi_input  ,
+        MIDI_INPUT_MODE[ "poll" ]   : poll_midi_input   ,
+        }
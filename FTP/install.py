@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Install Module
+        ftp.install
+
+    Written By:
+        Shane Hutter
+
+        Install time CONSTANTS, used by setup.py.  Nothing run by the daemons imports
+        this module.
+"""
+
+from . import INDICES
+from os     import environ
+from sys    import platform
+
+
+## Program details
+PROG    = {}
+PROG_AUTHOR         = "Shane Hutter"
+PROG_AUTHOR_EMAIL   = "shane@intentropycs.com"
+PROG_DESC           = """This software connects to the Fishman Triple Play USB MIDI
+receiver and converts the MIDI data into Open Sound Control data, which is then sent to a
+designated host.  This software will also recieve certain OSC messages, convert the message
+into MIDI data, and send it into the Fishman Triple Play allowing for some control of the device"""
+PROG_PACKAGES       = [ "FTP" , ]
+PROG_EXECUTABLES    = [ 
+        "ftposcd"       ,
+        "ftposc2midi"   ,
+        ]
+
+
+## System Constants
+PLATFORM            = platform
+ROOT_FS             = "/"
+PREFERED_PATHS      = (
+        "/usr/bin"          ,
+        "/usr/local/bin"    ,
+        "/bin"              ,
+        )
+PATH_DELIMITER      = ":"
+PATHS   = tuple(
+        environ[ "PATH" ].split( PATH_DELIMITER )
+        )
+# Determine system path
+PATH    = None
+for path in PATHS:
+    if path in PREFERED_PATHS:
+        PATH    = path
+        break
+if not PATH:
+    PATH    = PATHS[ INDICES[ "first" ] ]
+
+# Systemd
+SYSTEMD = {}
+SYSTEMD_UNIT_DIR        = "/usr/lib/systemd/system"
+SYSTEMD_SERVICE_UNIT    = "ftposcd.service"
@@ -0,0 +1,572 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Metrics Module
+        ftp.metrics
+
+    Written By:
+        Shane Hutter
+
+        A module for the runtime metrics of ftposcd and ftposc2midi.
+
+        Counting a message costs one list increment, by its MIDI status byte.  Per
+        channel, and per type, counts are summed from those when the metrics are read.
+        Latency from MIDI receive to OSC send is recorded in a LatencyHistogram.
+
+        Metrics are read with an OSC query, which is replied to with the metrics, or
+        scraped as plain text over HTTP.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from .midi  import (
+        midi_status_channels    , midi_status_type  ,
+        MIDI_CHANNELS           , MIDI_STATUS_BYTES , MIDI_STATUS_INDEX ,
+        )
+from http.server    import (
+        BaseHTTPRequestHandler  , HTTPServer    ,
+        )
+from liblo          import (
+        send    , Message   ,
+        )
+from threading      import Thread
+from time           import perf_counter_ns
+
+
+NANOSECONDS_PER_MICRO   = 1000
+NANOSECONDS_PER_SECOND  = 1000000000
+PERCENT                 = 100
+
+# LatencyHistogram
+'''
+    Values below HISTOGRAM_SUB_BUCKETS nanoseconds are counted exactly.  Every power of
+    two above is split into HISTOGRAM_SUB_BUCKETS / 2 buckets, so a value is counted
+    within 1 / 2 ** ( HISTOGRAM_SUB_BUCKET_BITS - 1 ), about 3%, of itself.
+'''
+HISTOGRAM_SUB_BUCKET_BITS   = 6
+HISTOGRAM_SUB_BUCKETS       = 1 << HISTOGRAM_SUB_BUCKET_BITS
+HISTOGRAM_MAXIMUM_BITS      = 40    # about 18 minutes in nanoseconds
+HISTOGRAM_PERCENTILES       = ( 50 , 90 , 99 , 99.9 , )
+LATENCY_PERCENTILES         = ( 50 , 99 , )
+
+METRICS_HTTP_HOST   = ""
+METRICS_CONTENT_TYPE    = "text/plain; version=0.0.4"
+METRICS_NO_CHANNEL  = "None"
+
+latency_report      = "{mode} input latency: {count} messages, {percentiles}"
+latency_percentile  = "p{percentile} {value:.1f}us"
+metrics_sample      = "{prefix}_{sample} {value}\n"
+metrics_label       = "{label}=\"{value}\""
+metrics_quantile    = "{:g}"
+
+
+
+class LatencyHistogram:
+    """
+        An HDR style histogram of input to send latency, in nanoseconds.
+
+        Buckets are preallocated, and recording a sample is an increment of the bucket
+        indexed by its magnitude, so recording never allocates, and every sample since
+        the daemon started is kept.
+    """
+
+    def __init__(
+            self                                                ,
+            sub_bucket_bits = HISTOGRAM_SUB_BUCKET_BITS         ,
+            maximum_bits    = HISTOGRAM_MAXIMUM_BITS            ,
+            ):
+        """
+            Preallocate the buckets
+        """
+        self.sub_bucket_bits    = sub_bucket_bits
+        self.half_bucket        = ( ONE << sub_bucket_bits ) >> ONE
+        self.maximum            = ( ONE << maximum_bits ) - ONE
+        self.counts             = [ ZERO ] * (
+                self.index( self.maximum ) + ONE
+                )
+        self.count              = ZERO
+        self.total              = ZERO
+        self.maximum_value      = ZERO
+
+
+    def index( self , value ):
+        """
+            Return the bucket index of a value
+        """
+        shift   = max(
+                value.bit_length() - self.sub_bucket_bits   ,
+                ZERO                                        ,
+                )
+        return shift * self.half_bucket + ( value >> shift )
+
+
+    def value( self , index ):
+        """
+            Return the lowest value counted by a bucket
+        """
+        shift   = max(
+                index // self.half_bucket - ONE ,
+                ZERO                            ,
+                )
+        return ( index - shift * self.half_bucket ) << shift
+
+
+    def record( self , received_ns ):
+        """
+            Record the time since received_ns, which is a perf_counter_ns()
+            timestamp taken when the MIDI message was recieved.
+        """
+        value   = min(
+                perf_counter_ns() - received_ns ,
+                self.maximum                    ,
+                )
+        self.counts[ self.index( value ) ]  += ONE
+        self.count  += ONE
+        self.total  += value
+        if value > self.maximum_value:
+            self.maximum_value  = value
+
+
+    def percentile( self , percentile ):
+        """
+            Return the percentile of the recorded samples in microseconds.
+        """
+        if not self.count:
+            return float( ZERO )
+        rank    = max(
+                self.count * percentile / PERCENT   ,
+                ONE                                 ,
+                )
+        seen    = ZERO
+        for index , count in enumerate( self.counts ):
+            seen    += count
+            if seen >= rank:
+                return self.value( index ) / NANOSECONDS_PER_MICRO
+        return self.maximum_value / NANOSECONDS_PER_MICRO
+
+
+    def mean( self ):
+        """
+            Return the mean of the recorded samples in microseconds.
+        """
+        if not self.count:
+            return float( ZERO )
+        return self.total / self.count / NANOSECONDS_PER_MICRO
+
+
+    def report( self , mode ):
+        """
+            Return a one line report of the recorded latency percentiles.
+        """
+        return latency_report.format(
+                mode        = mode          ,
+                count       = self.count    ,
+                percentiles = ", ".join(
+                    latency_percentile.format(
+                        percentile  = percentile                    ,
+                        value       = self.percentile( percentile ) ,
+                        )
+                    for percentile in LATENCY_PERCENTILES
+                    )                       ,
+                )
+
+
+
+class FTPMetrics:
+    """
+        The runtime metrics of one daemon, or one Tripleplay of ftposcd.
+
+        prefix names the daemon, and labels are added to every metric, such as the
+        Tripleplay.  The sender, ring, device, coalescer and control output of ftposcd
+        are read for their counters when set.
+    """
+
+    def __init__(
+            self            ,
+            prefix          ,
+            **labels        ,
+            ):
+        """
+            Preallocate the counters
+        """
+        self.prefix         = prefix
+        self.labels         = labels
+        self.statuses       = [ ZERO ] * MIDI_STATUS_BYTES
+        self.latency        = LatencyHistogram()
+        self.rejected       = ZERO
+        self.errors         = ZERO
+        self.sender         = None
+        self.ring           = None
+        self.device         = None
+        self.control_output = None
+        self.coalescer      = None
+        self.bridge         = None
+        self.started_ns     = perf_counter_ns()
+
+
+    def count( self , midi_data ):
+        """
+            Count a MIDI message, by its status byte
+        """
+        self.statuses[ midi_data[ MIDI_STATUS_INDEX ] ] += ONE
+
+
+    def record(
+            self        ,
+            midi_data   ,
+            received_ns ,
+            ):
+        """
+            Count a MIDI message sent as OSC, and record its latency
+        """
+        self.statuses[ midi_data[ MIDI_STATUS_INDEX ] ] += ONE
+        self.latency.record( received_ns )
+
+
+    def samples( self ):
+        """
+            Return a list of ( name , labels , value ) for every metric.
+        """
+        samples = [
+                (
+                    "uptime_seconds"                                        ,
+                    {}                                                      ,
+                    ( perf_counter_ns() - self.started_ns ) / NANOSECONDS_PER_SECOND    ,
+                    )   ,
+                ]
+
+        # Messages per channel, and per type
+        channels    = [ ZERO ] * ( MIDI_CHANNELS + ONE )
+        types       = dict()
+        for status , channel in enumerate( midi_status_channels() ):
+            count   = self.statuses[ status ]
+            if not count:
+                continue
+            channels[ channel ] += count
+            midi_type   = midi_status_type( status )
+            types[ midi_type ]  = types.get( midi_type , ZERO ) + count
+        for channel , count in enumerate( channels ):
+            samples.append(
+                    (
+                        "midi_messages_total"                               ,
+                        {
+                            "channel"   : channel if channel < MIDI_CHANNELS else METRICS_NO_CHANNEL    ,
+                            }                                               ,
+                        count                                               ,
+                        )
+                    )
+        for midi_type , count in sorted( types.items() , key = str ):
+            samples.append(
+                    (
+                        "midi_messages_total"                               ,
+                        {
+                            "type"  : midi_type ,
+                            }                                               ,
+                        count                                               ,
+                        )
+                    )
+        samples.append(
+                (
+                    "rejected_total"    ,
+                    {}                  ,
+                    self.rejected       ,
+                    )
+                )
+        samples.append(
+                (
+                    "errors_total"      ,
+                    {}                  ,
+                    self.errors         ,
+                    )
+                )
+
+        # ftposcd stages
+        if self.device:
+            samples.append(
+                    (
+                        "midi_input_depth"              ,
+                        {}                              ,
+                        self.device.queue.qsize()       ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "device_connects_total"         ,
+                        {}                              ,
+                        self.device.connects            ,
+                        )
+                    )
+        if self.ring:
+            samples.append(
+                    (
+                        "ring_depth"                    ,
+                        {}                              ,
+                        self.ring.depth()               ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "ring_high_water"               ,
+                        {}                              ,
+                        self.ring.high_water            ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "ring_dropped_total"            ,
+                        {}                              ,
+                        self.ring.dropped               ,
+                        )
+                    )
+        if self.sender:
+            for target in self.sender.targets:
+                osc_target  = {
+                        "target"    : target.name   ,
+                        }
+                samples.append(
+                        (
+                            "osc_sent_total"        ,
+                            osc_target              ,
+                            target.sent             ,
+                            )
+                        )
+                samples.append(
+                        (
+                            "osc_dropped_total"     ,
+                            osc_target              ,
+                            target.dropped          ,
+                            )
+                        )
+                samples.append(
+                        (
+                            "osc_errors_total"      ,
+                            osc_target              ,
+                            target.errors           ,
+                            )
+                        )
+            samples.append(
+                    (
+                        "osc_unencodable_total"         ,
+                        {}                              ,
+                        self.sender.unencodable         ,
+                        )
+                    )
+        if self.bridge:
+            samples.append(
+                    (
+                        "bridge_sent_total"             ,
+                        {}                              ,
+                        self.bridge.sent                ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "bridge_rejected_total"         ,
+                        {}                              ,
+                        self.bridge.rejected            ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "bridge_errors_total"           ,
+                        {}                              ,
+                        self.bridge.errors              ,
+                        )
+                    )
+        if self.coalescer:
+            samples.append(
+                    (
+                        "coalesce_received_total"       ,
+                        {}                              ,
+                        self.coalescer.received         ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "coalesced_total"               ,
+                        {}                              ,
+                        self.coalescer.coalesced        ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "coalesce_ratio"                ,
+                        {}                              ,
+                        self.coalescer.ratio()          ,
+                        )
+                    )
+        if self.control_output:
+            samples.append(
+                    (
+                        "control_errors_total"          ,
+                        {}                              ,
+                        self.control_output.errors      ,
+                        )
+                    )
+
+        # Latency
+        if self.latency.count:
+            for percentile in HISTOGRAM_PERCENTILES:
+                samples.append(
+                        (
+                            "latency_microseconds"                          ,
+                            {
+                                "quantile"  : metrics_quantile.format( percentile / PERCENT )   ,
+                                }                                           ,
+                            self.latency.percentile( percentile )           ,
+                            )
+                        )
+            samples.append(
+                    (
+                        "latency_microseconds_mean"                     ,
+                        {}                                              ,
+                        self.latency.mean()                             ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "latency_microseconds_max"                      ,
+                        {}                                              ,
+                        self.latency.maximum_value / NANOSECONDS_PER_MICRO  ,
+                        )
+                    )
+            samples.append(
+                    (
+                        "latency_microseconds_count"                    ,
+                        {}                                              ,
+                        self.latency.count                              ,
+                        )
+                    )
+        return samples
+
+
+    def sample_name(
+            self    ,
+            name    ,
+            labels  ,
+            ):
+        """
+            Return a metric name with its labels, and the labels of the daemon
+        """
+        labels  = dict(
+                self.labels ,
+                **labels    ,
+                )
+        if not labels:
+            return name
+        return "{name}{{{labels}}}".format(
+                name    = name  ,
+                labels  = ",".join(
+                    metrics_label.format(
+                        label   = label ,
+                        value   = value ,
+                        )
+                    for label , value in labels.items()
+                    )           ,
+                )
+
+
+    def text( self ):
+        """
+            Return the metrics as plain text, one metric per line, in the Prometheus
+            text format.
+        """
+        return "".join(
+                metrics_sample.format(
+                    prefix  = self.prefix                           ,
+                    sample  = self.sample_name(
+                        name    ,
+                        labels  ,
+                        )                                           ,
+                    value   = value                                 ,
+                    )
+                for name , labels , value in self.samples()
+                )
+
+
+    def osc_query(
+            self        ,
+            path        ,
+            args        ,
+            typespec    ,
+            source      ,
+            ):
+        """
+            OSC Server method, reply to the sender of a query with the metrics.
+
+            The reply is sent to the same path, with a string name followed by its
+            value for every metric.
+        """
+        reply   = list()
+        for name , labels , value in self.samples():
+            reply.append(
+                    self.sample_name(
+                        name    ,
+                        labels  ,
+                        )
+                    )
+            reply.append( value )
+        send(
+                source          ,
+                Message(
+                    path    ,
+                    *reply  ,
+                    )           ,
+                )
+
+
+
+class MetricsRequestHandler( BaseHTTPRequestHandler ):
+    """
+        Answer every GET with the plain text metrics of the server's FTPMetrics
+    """
+
+    def do_GET( self ):
+        """
+            Reply with the metrics
+        """
+        body    = "".join(
+                metrics.text()
+                for metrics in self.server.metrics
+                ).encode()
+        self.send_response( 200 )
+        self.send_header(
+                "Content-Type"          ,
+                METRICS_CONTENT_TYPE    ,
+                )
+        self.send_header(
+                "Content-Length"        ,
+                str( len( body ) )      ,
+                )
+        self.end_headers()
+        self.wfile.write( body )
+
+
+    def log_message( self , *args ):
+        """
+            Scrapes are not logged
+        """
+        return
+
+
+
+def metrics_http_server(
+        port        ,
+        *metrics    ,
+        ):
+    """
+        Serve the plain text metrics of every FTPMetrics on port, from a daemon thread.
+
+        Return the HTTPServer, stop it with shutdown().
+    """
+    http_server = HTTPServer(
+            ( METRICS_HTTP_HOST , port , )  ,
+            MetricsRequestHandler           ,
+            )
+    http_server.metrics = metrics
+    Thread(
+            target  = http_server.serve_forever ,
+            daemon  = True                      ,
+            ).start()
+    return http_server
@@ -12,15 +12,17 @@ Fishman Tripleplay MIDI to OSC converter
 
 from .      import (
         HEX_NOTATION    , MAXIMUM_SIGNED_BYTE   , WITH_ITEM , 
-        INDICES         ,
+        INDICES         , MIDI_PICKUP_NAME      ,
         ZERO            , ONE                   ,
         )
 from mido   import (
         get_input_names , get_output_names  ,   open_output ,
         Message         ,
         )
-from rtmidi             import API_LINUX_ALSA
-from rtmidi.midiutil    import open_midiport
+from rtmidi             import (
+        API_LINUX_ALSA  , MidiOut   , RtMidiError   ,
+        )
+from threading          import Lock
 
 
 # MIDI CONST
@@ -31,15 +33,72 @@ MIDI_FALSE              = ZERO
 MIDI_TRUE               = MAXIMUM_SIGNED_BYTE
 
 MIDI_CHANNELS           = 16
+MIDI_NO_CHANNEL         = MIDI_CHANNELS   # Index for messages without a channel (SysEx)
+MIDI_CHANNEL_MASK       = 0x0F
+MIDI_STATUS_BYTES       = 256
+MIDI_CHANNEL_STATUS     = range( 0x80 , 0xF0 )  # Channel voice message status bytes
+MIDI_CONTROL_STATUS     = range( 0xB0 , 0xC0 )
+MIDI_PITCHWHEEL_STATUS  = range( 0xE0 , 0xF0 )
 
 MIDI_DATA_DELIMITER     = "="
 MIDI_TUPLE_LENGTH       = 4
+MIDI_TUPLE_PADDING      = tuple(
+        [ ZERO ] * ( MIDI_TUPLE_LENGTH - length )
+        for length in range( MIDI_TUPLE_LENGTH + ONE )
+        )
 MIDI_BYTES_INDICES      = {
         "type"      : 0 ,
         "note"      : 1 ,
         "velocity"  : 2 ,
         "time"      : 3 ,
         }
+MIDI_STATUS_INDEX       = MIDI_BYTES_INDICES[ "type" ]
+
+# mido message types, by the high nibble of channel status bytes, or the status byte of
+#   system messages
+MIDI_STATUS_TYPES       = {
+        0x80    : "note_off"        ,
+        0x90    : "note_on"         ,
+        0xA0    : "polytouch"       ,
+        0xB0    : "control_change"  ,
+        0xC0    : "program_change"  ,
+        0xD0    : "aftertouch"      ,
+        0xE0    : "pitchwheel"      ,
+        0xF0    : "sysex"           ,
+        0xF1    : "quarter_frame"   ,
+        0xF2    : "songpos"         ,
+        0xF3    : "song_select"     ,
+        0xF6    : "tune_request"    ,
+        0xF8    : "clock"           ,
+        0xFA    : "start"           ,
+        0xFB    : "continue"        ,
+        0xFC    : "stop"            ,
+        0xFE    : "active_sensing"  ,
+        0xFF    : "reset"           ,
+        }
+MIDI_STATUS_TYPE_MASK   = 0xF0
+
+# Length in bytes of each message, by the same status keys as MIDI_STATUS_TYPES.
+#   SysEx can not be carried in an OSC Midi message, and has no length here.
+MIDI_STATUS_LENGTHS     = {
+        0x80    : 3 ,
+        0x90    : 3 ,
+        0xA0    : 3 ,
+        0xB0    : 3 ,
+        0xC0    : 2 ,
+        0xD0    : 2 ,
+        0xE0    : 3 ,
+        0xF1    : 2 ,
+        0xF2    : 3 ,
+        0xF3    : 2 ,
+        0xF6    : 1 ,
+        0xF8    : 1 ,
+        0xFA    : 1 ,
+        0xFB    : 1 ,
+        0xFC    : 1 ,
+        0xFE    : 1 ,
+        0xFF    : 1 ,
+        }
 
 FTP_MIDI_NAME           = "Fishman TriplePlay MIDI"
 
@@ -47,6 +106,8 @@ FTP_MONO_MODE_CC    = 126
 FTP_POLY_MODE_CC    = 127
 FTP_CC_CHANNEL      = 0
 
+MIDI_CONTROL_ATTEMPTS   = 2
+
 FTP_CHANNEL_TO_OUTPORT = {
         0   : "String 1 low"    ,
         10  : "String 1 high"   ,
@@ -79,6 +140,7 @@ FTP_OUTPORT_TO_CHANNEL = {
 
 FTPOSC2MIDI_ALL_OUTPORT = "All Strings"
 FTPOSC2MIDI_CLIENT      = "ftposc2midi"
+FTPOSC2MIDI_CHANNEL     = ZERO  # Channel sent out by every string outport
 
 # Midi Variables
 midi_cc = {
@@ -88,13 +150,10 @@ midi_cc = {
         "value"     : int()             ,
         }
 
-midi_outport = {
-        "client_name"   : FTPOSC2MIDI_CLIENT    ,
-        "virtual"       : True                  ,
-        }
+midi_invalid_message    = "not a complete MIDI message: {midi_data}"
 
 
-def ftp_midi_string_outports():
+def ftp_midi_string_outports( output_channel = FTPOSC2MIDI_CHANNEL ):
     """
         Create a list of outputs for each string, and fretboard split (Mono Mode)
 
@@ -103,22 +162,31 @@ def ftp_midi_string_outports():
         channel in which each string, and it's fretboard split's channel,
         as output by the Fishman Triple Play, when in Mono Mode.
 
+        Every output sends out output_channel.
+
         Indices correlating to unrelated MIDI channels return None.
+
+        The "All Strings" output follows, at index MIDI_CHANNELS.  Every string
+        output also sends each message out of it, on its original channel.
     """
     midi_outputs    = list()
+    all_outport     = FTPStringOutport(
+            FTPOSC2MIDI_ALL_OUTPORT ,
+            None                    ,
+            )
      # Create per-channel MIDI Outports
     for midi_channel in range( MIDI_CHANNELS ):
         if midi_channel in FTP_CHANNEL_TO_OUTPORT:
-            midi_outport.update(
-                    {
-                        "name"  : FTP_CHANNEL_TO_OUTPORT[ midi_channel ]    ,
-                        }
-                    )
             midi_outputs.append(
-                    open_output( **midi_outport )
+                    FTPStringOutport(
+                        FTP_CHANNEL_TO_OUTPORT[ midi_channel ]  ,
+                        output_channel                          ,
+                        aggregate   = all_outport               ,
+                        )
                     )
         else:
             midi_outputs.append( None )
+    midi_outputs.append( all_outport )
     return tuple( midi_outputs )
 
 
@@ -139,6 +207,36 @@ def ftp_inputs():
     return ftp_inputs
 
 
+def ftp_pickup_name( device_index ):
+    """
+        Return the OSC path segment of the Tripleplay at device_index in ftp_inputs()
+
+        The first Tripleplay is MIDI_PICKUP_NAME, and every other is followed by its
+        device index: tripleplay, tripleplay1, tripleplay2, ...
+    """
+    if device_index == FTP_FIRST_DEVICE_INDEX:
+        return MIDI_PICKUP_NAME
+    return "{name}{index}".format(
+            name    = MIDI_PICKUP_NAME  ,
+            index   = device_index      ,
+            )
+
+
+def ftp_pickup_index( pickup_name ):
+    """
+        Return the device index of an OSC path segment from ftp_pickup_name(), or None
+        if it is not a Tripleplay.
+    """
+    if not pickup_name.startswith( MIDI_PICKUP_NAME ):
+        return None
+    device_index    = pickup_name[ len( MIDI_PICKUP_NAME ): ]
+    if not device_index:
+        return FTP_FIRST_DEVICE_INDEX
+    if device_index.isdigit():
+        return int( device_index )
+    return None
+
+
 def ftp_outputs():
     """
         Return a list of MIDI outputs for the for the Fishman TriplePlay
@@ -193,29 +291,293 @@ def midi_tuple( message ):
         Convert a mido midi message into a tuple of 4 integers.
 
         This is the format used to send an OSC Midi message
-
-        message.bytes() will give a list of integer values
-        If the final values are 0, then they will not be present in the list.
-            You will need to pad the returned list with zeros so its len() == 4
-            then return the list as a tuple
     """
     '''
         Does the midi tuple take the channel into account?
     '''
+    return midi_data_tuple(
+            message.bytes()
+            )
+
+
+def midi_data_tuple( midi_data ):
+    """
+        Convert a list of MIDI bytes into a tuple of 4 integers.
 
-    # Convert message into a list
-    midi_data  = message.bytes()
-    # Pad the list with 0's so it is always has a length of 4 (and ot greater)
+        message.bytes() will give a list of integer values
+        If the final values are 0, then they will not be present in the list.
+            The list is padded with zeros from MIDI_TUPLE_PADDING so its len() == 4
+            then returned as a tuple
+    """
     if len( midi_data ) <= MIDI_TUPLE_LENGTH:
-        for padding in range(
-                len( midi_data )    ,
-                MIDI_TUPLE_LENGTH   ,
-                ):
-            midi_data.append( ZERO )
+        return tuple(
+                midi_data + MIDI_TUPLE_PADDING[ len( midi_data ) ]
+                )
     else:
         # Siliently log as a warning
-        pass
-    return tuple( midi_data )
+        return tuple( midi_data )
+
+
+def midi_status_type( status ):
+    """
+        Return the mido message type of a MIDI status byte, or None if it is not a
+        status byte.
+    """
+    if status in MIDI_CHANNEL_STATUS:
+        status  &= MIDI_STATUS_TYPE_MASK
+    return MIDI_STATUS_TYPES.get( status )
+
+
+def midi_status_channels():
+    """
+        Return a tuple, indexed by MIDI status byte, of the MIDI channel of the message.
+
+        Channel voice messages carry their channel in the low nibble of the status byte.
+        All other messages (SysEx, System Common, Real Time) have no channel, and
+        index MIDI_NO_CHANNEL.
+    """
+    return tuple(
+            status & MIDI_CHANNEL_MASK if status in MIDI_CHANNEL_STATUS else MIDI_NO_CHANNEL
+            for status in range( MIDI_STATUS_BYTES )
+            )
+
+
+def midi_message_lengths():
+    """
+        Return a tuple, indexed by MIDI status byte, of the length of the message.
+
+        Data bytes, SysEx, and undefined status bytes have a length of 0.
+    """
+    return tuple(
+            MIDI_STATUS_LENGTHS.get(
+                status & MIDI_STATUS_TYPE_MASK if status in MIDI_CHANNEL_STATUS else status ,
+                ZERO                                                                        ,
+                )
+            for status in range( MIDI_STATUS_BYTES )
+            )
+
+
+
+class FTPStringOutport:
+    """
+        A virtual MIDI output of ftposc2midi, for one string, sending raw MIDI bytes
+        through rtmidi, with no mido Message per message.
+
+        Channel voice messages are sent out channel, by rewriting the low nibble of
+        the status byte from a table of every status byte, or on their original
+        channel when channel is None.  The zero padding of an OSC Midi message is
+        dropped by the length of its message type.
+
+        With an aggregate FTPStringOutport, such as "All Strings", each message is
+        also sent out of the aggregate, unchanged, from the same length lookup.
+    """
+
+    def __init__(
+            self                                ,
+            name                                ,
+            channel     = FTPOSC2MIDI_CHANNEL   ,
+            midi_out    = None                  ,
+            aggregate   = None                  ,
+            ):
+        """
+            Open the virtual output name, of the ftposc2midi client, unless an
+            rtmidi MidiOut is given
+        """
+        self.name       = name
+        self.channel    = channel
+        self.aggregate  = aggregate
+        if channel is None:
+            self.statuses   = tuple( range( MIDI_STATUS_BYTES ) )
+        else:
+            self.channel    &= MIDI_CHANNEL_MASK
+            self.statuses   = tuple(
+                    status & MIDI_STATUS_TYPE_MASK | self.channel if status in MIDI_CHANNEL_STATUS else status
+                    for status in range( MIDI_STATUS_BYTES )
+                    )
+        self.lengths    = midi_message_lengths()
+        self.midi_out   = midi_out
+        if not self.midi_out:
+            self.midi_out   = MidiOut( name = FTPOSC2MIDI_CLIENT )
+            self.midi_out.open_virtual_port( name )
+
+
+    def send( self , midi_data ):
+        """
+            Send the MIDI bytes of a message, padded or not, out the channel of the
+            outport.  Raise ValueError if midi_data is not a complete MIDI message.
+        """
+        status  = midi_data[ MIDI_STATUS_INDEX ]
+        length  = self.lengths[ status ]
+        if not length or len( midi_data ) < length:
+            raise ValueError(
+                    midi_invalid_message.format( midi_data = midi_data )
+                    )
+        self.midi_out.send_message(
+                [ self.statuses[ status ] , *midi_data[ ONE : length ] ]
+                )
+        if self.aggregate:
+            self.aggregate.midi_out.send_message( midi_data[ : length ] )
+
+
+    def close( self ):
+        """
+            Close the virtual output
+        """
+        self.midi_out.close_port()
+        self.midi_out.delete()
+
+
+
+class FTPStringBridge:
+    """
+        The string outports of ftposc2midi, opened in the process which recieves the
+        Tripleplay, so recieved MIDI bytes are sent straight out of them, with no OSC
+        encode, socket, or decode between.
+
+        The outport of each message is looked up by its status byte, which carries
+        the channel.  Messages without a string outport are rejected, as ftposc2midi
+        rejects their OSC paths.
+    """
+
+    def __init__(
+            self                                    ,
+            output_channel  = FTPOSC2MIDI_CHANNEL   ,
+            midi_outports   = None                  ,
+            ):
+        """
+            Open the string outports, each sending out output_channel, unless a tuple
+            of them, as returned by ftp_midi_string_outports(), is given
+        """
+        self.midi_outports  = midi_outports or ftp_midi_string_outports( output_channel )
+        self.outports       = tuple(
+                self.midi_outports[ channel ] if channel < MIDI_CHANNELS else None
+                for channel in midi_status_channels()
+                )
+        self.sent           = ZERO
+        self.rejected       = ZERO
+        self.errors         = ZERO
+
+
+    def send( self , midi_data ):
+        """
+            Send the MIDI bytes of a message out its string outport
+        """
+        midi_outport    = self.outports[ midi_data[ MIDI_STATUS_INDEX ] ]
+        if not midi_outport:
+            self.rejected   += ONE
+            return
+        try:
+            midi_outport.send( midi_data )
+        except ( OSError , RtMidiError , ValueError ):
+            # Not valid MIDI, or the outport failed
+            self.errors     += ONE
+            return
+        self.sent   += ONE
+
+
+    def close( self ):
+        """
+            Close every string outport
+        """
+        for midi_outport in self.midi_outports:
+            if midi_outport:
+                midi_outport.close()
+
+
+
+class FTPControlOutput:
+    """
+        A long lived MIDI output into the Fishman TriplePlay, shared by every OSC
+        method which sends control messages into it.
+
+        The output is opened the first time a message is sent, and kept open, so a
+        control message costs one send() with no port setup.  If the device has gone
+        away, the send fails, the output is closed, and it is reopened lazily by
+        retrying once.
+    """
+
+    def __init__(
+            self                                        ,
+            device_index    = FTP_FIRST_DEVICE_INDEX    ,
+            ):
+        """
+            device_index is the index of the device in ftp_outputs()
+        """
+        self.device_index   = device_index
+        self.midi_out       = None
+        self.lock           = Lock()
+        self.errors         = ZERO
+
+
+    def open( self ):
+        """
+            Open the MIDI output, if it is not already open
+        """
+        if not self.midi_out:
+            self.midi_out   = open_output(
+                    ftp_outputs()[ self.device_index ]
+                    )
+
+
+    def connect( self ):
+        """
+            Open the MIDI output ahead of the first send.
+
+            Return True if the output is open.  If the device is not connected, the
+            output is left to be opened by the first send.
+        """
+        with self.lock:
+            try:
+                self.open()
+                return True
+            except ( IndexError , OSError , RtMidiError ):
+                self.reset()
+                return False
+
+
+    def close( self ):
+        """
+            Close the MIDI output.  It will be reopened by the next send.
+        """
+        with self.lock:
+            self.reset()
+
+
+    def reset( self ):
+        """
+            Close the MIDI output, ignoring errors from a device that has gone away.
+        """
+        if self.midi_out:
+            try:
+                self.midi_out.close()
+            except ( OSError , RtMidiError ):
+                pass
+        self.midi_out   = None
+
+
+    def send( self , message ):
+        """
+            Send a mido Message into the Fishman TriplePlay.
+
+            Return True if the message was sent.  On failure the output is reopened,
+            and the message is sent once more, before giving up and counting an error.
+        """
+        with self.lock:
+            for attempt in range( MIDI_CONTROL_ATTEMPTS ):
+                try:
+                    self.open()
+                    self.midi_out.send( message )
+                    return True
+                except ( IndexError , OSError , RtMidiError ):
+                    # The device is not connected, or has gone away
+                    self.reset()
+        # Counted, and reported by FTP.metrics
+        self.errors += ONE
+        return False
+
+
+# Shared control output, used by the OSC methods registered by register_ftp_osc_input()
+ftp_control_output  = FTPControlOutput()
 
 
 def ftp_control():
@@ -238,41 +600,37 @@ def ftp_mono_mode( *args ):
         Any type as input, True and non-zero are True, everything else is False.
     """
     from .osc   import OSC_ARGS_INDICES
-    # Open midi output
-    with open_output(
-            ftp_outputs()[ FTP_FIRST_DEVICE_INDEX ]
-            ) as midi_out:
-        # update midi_cc values to fit either case
+    # update midi_cc values to fit either case
+    midi_cc.update(
+            {
+                "value"     : MIDI_TRUE ,
+                }
+            )
+    # Determine if mode is toggled on or off
+    if bool(
+        args[
+            OSC_ARGS_INDICES[ "args" ]
+            ][
+                INDICES[ "first" ]
+                ]
+            ):
+        # Set midi_cc for FTP for Mono Mode
         midi_cc.update(
                 {
-                    "value"     : MIDI_TRUE ,
+                    "control"   : FTP_MONO_MODE_CC  ,
                     }
                 )
-        # Determine if mode is toggled on or off
-        if bool(
-            args[
-                OSC_ARGS_INDICES[ "args" ]
-                ][
-                    INDICES[ "first" ]
-                    ]
-                ):
-            # Set midi_cc for FTP for Mono Mode
-            midi_cc.update(
-                    {
-                        "control"   : FTP_MONO_MODE_CC  ,
-                        }
-                    )
-        else:
-            # Set midi_cc for FTP for Poly Mode
-            midi_cc.update(
-                    {
-                        "control"   : FTP_POLY_MODE_CC  ,
-                        }
-                    )
-        # Send out the midi_cc as Midi message
-        midi_out.send(
-                Message( **midi_cc )
+    else:
+        # Set midi_cc for FTP for Poly Mode
+        midi_cc.update(
+                {
+                    "control"   : FTP_POLY_MODE_CC  ,
+                    }
                 )
+    # Send out the midi_cc as Midi message, through the shared control output
+    ftp_control_output.send(
+            Message( **midi_cc )
+            )
     return
 
 
@@ -288,41 +646,37 @@ def ftp_poly_mode( *args ):
         Any type as input, True and non-zero are True, everything else is False.
     """
     from .osc   import OSC_ARGS_INDICES
-    # Open midi output
-    with open_output(
-            ftp_outputs()[ FTP_FIRST_DEVICE_INDEX ]
-            ) as midi_out:
-        # update midi_cc values to fit either case
+    # update midi_cc values to fit either case
+    midi_cc.update(
+            {
+                "value"     : MIDI_TRUE ,
+                }
+            )
+    # Determine if mode is toggled on or off
+    if bool(
+        args[
+            OSC_ARGS_INDICES[ "args" ]
+            ][
+                INDICES[ "first" ]
+                ]
+            ):
+        # Set midi_cc for FTP for Poly Mode
         midi_cc.update(
                 {
-                    "value"     : MIDI_TRUE ,
+                    "control"   : FTP_POLY_MODE_CC  ,
                     }
                 )
-        # Determine if mode is toggled on or off
-        if bool(
-            args[
-                OSC_ARGS_INDICES[ "args" ]
-                ][
-                    INDICES[ "first" ]
-                    ]
-                ):
-            # Set midi_cc for FTP for Poly Mode
-            midi_cc.update(
-                    {
-                        "control"   : FTP_POLY_MODE_CC  ,
-                        }
-                    )
-        else:
-            # Set midi_cc for FTP for Mono Mode
-            midi_cc.update(
-                    {
-                        "control"   : FTP_MONO_MODE_CC  ,
-                        }
-                    )
-        # Send out the midi_cc as Midi message
-        midi_out.send(
-                Message( **midi_cc )
+    else:
+        # Set midi_cc for FTP for Mono Mode
+        midi_cc.update(
+                {
+                    "control"   : FTP_MONO_MODE_CC  ,
+                    }
                 )
+    # Send out the midi_cc as Midi message, through the shared control output
+    ftp_control_output.send(
+            Message( **midi_cc )
+            )
     return
 
 
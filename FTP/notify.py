@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Notify Module
+        ftp.notify
+
+    Written By:
+        Shane Hutter
+
+        A module for telling systemd the state of ftposcd, for a Type=notify service.
+
+        systemd passes the path of its notification socket in NOTIFY_SOCKET.  When it
+        is not set, such as when ftposcd is run from a shell, nothing is sent.
+"""
+
+from os     import environ
+from socket import (
+        socket  ,
+        AF_UNIX , SOCK_DGRAM    ,
+        )
+
+
+NOTIFY_SOCKET           = "NOTIFY_SOCKET"
+NOTIFY_ABSTRACT_PREFIX  = "@"
+NOTIFY_ABSTRACT_NUL     = "\0"
+NOTIFY_DELIMITER        = "\n"
+
+SD_NOTIFY   = {
+        "ready"     : "READY=1"         ,
+        "stopping"  : "STOPPING=1"      ,
+        "status"    : "STATUS={}"       ,
+        }
+
+
+
+def sd_notify( *states ):
+    """
+        Send states, such as SD_NOTIFY[ "ready" ], to systemd in one notification.
+
+        Return True if it was sent, False if not run by systemd, or it could not be sent.
+    """
+    notify_path = environ.get( NOTIFY_SOCKET )
+    if not notify_path:
+        return False
+    if notify_path.startswith( NOTIFY_ABSTRACT_PREFIX ):
+        # An abstract socket, named with a leading NUL byte
+        notify_path = NOTIFY_ABSTRACT_NUL + notify_path[ len( NOTIFY_ABSTRACT_PREFIX ) : ]
+    try:
+        with socket(
+                AF_UNIX     ,
+                SOCK_DGRAM  ,
+                ) as notify_socket:
+            notify_socket.sendto(
+                    NOTIFY_DELIMITER.join( states ).encode()    ,
+                    notify_path                                 ,
+                    )
+    except OSError:
+        return False
+    return True
@@ -13,15 +13,24 @@ Fishman Tripleplay MIDI to OSC converter
 from .      import (
         MIDI_PICKUP_NAME    , OUTPUT    , INPUT ,
         HOSTNAME            ,
+        ZERO                , ONE       ,
         )
 from .midi  import (
         ftp_mono_mode   , ftp_pedal     , ftp_poly_mode , ftp_sustain   ,
-        MIDI_FALSE      , MIDI_TRUE     ,
+        MIDI_FALSE      , MIDI_TRUE     , MIDI_CHANNELS ,
+        MIDI_STATUS_INDEX               , midi_status_channels  ,
+        ftp_pickup_index                ,
         )
 from liblo  import (
-        Address , AddressError  , Message       ,
-        send    , ServerError   , ServerThread  ,
+        Address , AddressError  , Bundle        , Message   ,
+        send    , ServerError   , ServerThread  , time      ,
+        TCP     , UDP           , UNIX          ,
         )
+from .transport import (
+        osc_url , OSC_TRANSPORTS    ,
+        )
+from functools import partial
+from struct import Struct
 from sys    import exit
 
 
@@ -32,6 +41,8 @@ OSC_INPUT_PATHS = {
         "sustain pedal" : "sustain" ,
         "midi pedal"    : "pedal"   ,
         "midi panic"    : "panic"   ,
+        "metrics"       : "metrics" ,
+        "reload"        : "reload"  ,
         }
 
 OSC_TYPETAGS    = {
@@ -76,6 +87,36 @@ FTP_OSC_PATH_INDICES    = {
         "channel"   : 4 ,
         }
 
+OSC_NO_CHANNEL  = "None"
+OSC_PATH_CACHE_SIZE = 4096
+
+# liblo server protocol of each transport
+OSC_SERVER_PROTOCOLS    = {
+        OSC_TRANSPORTS[ "udp" ]     : UDP   ,
+        OSC_TRANSPORTS[ "unix" ]    : UNIX  ,
+        OSC_TRANSPORTS[ "tcp" ]     : TCP   ,
+        }
+
+# OSC packet encoding
+OSC_ALIGNMENT       = 4
+OSC_STRING_END      = b"\0"
+OSC_TYPETAG_PREFIX  = ","
+OSC_BUNDLE_TAG      = b"#bundle\0"
+OSC_MIDI_LENGTH     = 4
+OSC_TIMETAG_FRACTION    = 1 << 32
+OSC_TIMETAG_STRUCT      = Struct( ">II" )
+OSC_SIZE_STRUCT         = Struct( ">i" )
+
+# Structs packing 1 to 4 MIDI bytes into an OSC Midi argument, indexed by the number of
+#   MIDI bytes.  pack_into zeroes the pad bytes (x) of a struct.
+OSC_MIDI_STRUCTS    = (
+        None            ,
+        Struct( "B3x" ) ,
+        Struct( "2B2x" ),
+        Struct( "3Bx" ) ,
+        Struct( "4B" )  ,
+        )
+
 
 
 # osc_path info
@@ -102,6 +143,29 @@ osc_path_format = {
 
 
 
+def osc_server_address(
+        url         ,
+        osc_port    ,
+        ):
+    """
+        Return the ( port , protocol ) of a liblo server for an OSC URL.
+
+        An empty URL serves UDP on osc_port.  The port of a unix:// URL is the path of
+        the socket.
+    """
+    osc_host , port , transport = osc_url(
+            url or str( osc_port )  ,
+            osc_port                ,
+            )
+    if transport == OSC_TRANSPORTS[ "unix" ]:
+        port    = osc_host
+    return (
+            port                                ,
+            OSC_SERVER_PROTOCOLS[ transport ]   ,
+            )
+
+
+
 class OSCServer( ServerThread ):
     """
         Used to instatiate an Open Sound Control server.
@@ -112,6 +176,9 @@ class OSCServer( ServerThread ):
         
         The server will automatically start upon intantiation
 
+        proto is the liblo protocol, UDP, TCP, or UNIX, in which case port is the
+        path of the socket.  See osc_server_address().
+
 
         ServerThread methods:
             add_bundle_handlers
@@ -129,14 +196,18 @@ class OSCServer( ServerThread ):
     """
 
     def __init__( 
-            self    ,
-            port    ,
+            self            ,
+            port            ,
+            proto   = UDP   ,
             ):
         """
             Initialize the OSC Server
         """
         # Inherit port from parent class
-        super().__init__( port )
+        super().__init__(
+                port    ,
+                proto   ,
+                )
 
 
     def __enter__( self ):
@@ -187,29 +258,284 @@ def osc_target(
 
 
 
-def send_osc_midi( 
-        osc_target  ,
+def osc_output_paths(
+        hostname    = HOSTNAME          ,
+        midi_pickup = MIDI_PICKUP_NAME  ,
+        ):
+    """
+        Render the OSC output path for every MIDI channel once.
+
+        Return a tuple of MIDI_CHANNELS + 1 paths, indexed by MIDI channel, with the
+        path for messages without a channel (SysEx) in the final index, MIDI_NO_CHANNEL.
+    """
+    return tuple(
+            osc_path.format(
+                hostname    = hostname      ,
+                midi_pickup = midi_pickup   ,
+                direction   = OUTPUT        ,
+                channel     = channel       ,
+                )
+            for channel in list( range( MIDI_CHANNELS ) ) + [ OSC_NO_CHANNEL ]
+            )
+
+
+
+def osc_status_paths( osc_paths ):
+    """
+        Build the MIDI to OSC translation table once, at startup.
+
+        osc_paths is the tuple returned by osc_output_paths(), indexed by MIDI channel.
+        Return a tuple indexed by MIDI status byte, so the OSC path of a message is
+        osc_status_paths[ midi_data[ 0 ] ], with no formatting or parsing per message.
+    """
+    return tuple(
+            osc_paths[ channel ]
+            for channel in midi_status_channels()
+            )
+
+
+
+class OSCMidiEncoder:
+    """
+        Encode OSC Midi messages for the /hostname/tripleplay/output/channel paths,
+        without allocating per message.
+
+        One bytearray per path in osc_paths holds the complete packet, with the padded
+        path and typetag already written.  Encoding a message only packs its MIDI bytes
+        into the last 4 bytes of the packet for its channel, and returns a preallocated
+        memoryview of the packet, ready to be sent on a socket.
+
+        The packet and offset are bound into a partial pack_into for every packet and
+        number of MIDI bytes, as a call with arguments before *midi_data builds a list
+        of them, which allocates on every message.
+
+        The memoryview is overwritten by the next message on the same channel, so it
+        must be sent (or copied) before encoding again.
+    """
+
+    def __init__( self , osc_paths ):
+        """
+            Write the packet for every path in osc_paths, as returned by osc_output_paths()
+        """
+        packets = [
+                bytearray(
+                    osc_midi_packet(
+                        osc_path                        ,
+                        ( ZERO , ) * OSC_MIDI_LENGTH    ,
+                        )
+                    )
+                for osc_path in osc_paths
+                ]
+        views   = [
+                memoryview( packet )
+                for packet in packets
+                ]
+
+        packers = [
+                ( None , ) + tuple(
+                    partial(
+                        osc_midi_struct.pack_into       ,
+                        packet                          ,
+                        len( packet ) - OSC_MIDI_LENGTH ,
+                        )
+                    for osc_midi_struct in OSC_MIDI_STRUCTS[ ONE : ]
+                    )
+                for packet in packets
+                ]
+
+        # Index every table by MIDI status byte
+        status_channels = midi_status_channels()
+        self.views      = tuple(
+                views[ channel ]
+                for channel in status_channels
+                )
+        self.packers    = tuple(
+                packers[ channel ]
+                for channel in status_channels
+                )
+
+
+    def encode( self , midi_data ):
+        """
+            Encode a list of MIDI bytes, as returned by message.bytes()
+
+            Return a memoryview of the OSC packet, or None if the MIDI data does not fit
+            an OSC Midi argument (SysEx longer than 4 bytes).
+        """
+        if len( midi_data ) > OSC_MIDI_LENGTH:
+            return None
+        status  = midi_data[ MIDI_STATUS_INDEX ]
+        self.packers[ status ][ len( midi_data ) ]( *midi_data )
+        return self.views[ status ]
+
+
+
+class OSCPathCache( dict ):
+    """
+        A dictionary of OSC path to MIDI outport, for dispatching OSC Midi messages
+        recieved by ftposc2midi.
+
+        midi_outports is the tuple returned by ftp_midi_string_outports(), indexed by
+        MIDI channel, and followed by the "All Strings" outport, which has no path.
+
+        The paths sent by this host are cached when created.  Paths from other hosts
+        are parsed once, the first time they are looked up, and cached.
+        Paths which do not match /*/tripleplay/output/channel, or a channel without an
+        outport, are cached as None, so they are rejected by a single lookup too.
+        Every Tripleplay of a host (tripleplay, tripleplay1, ...) is sent to the same
+        string outports.
+
+        At most OSC_PATH_CACHE_SIZE paths are cached, so a sender making up paths
+        can not grow the cache without bound.  Past that, a path which does not end
+        in /output/ and a channel with an outport is rejected without splitting it,
+        and only the paths which do are parsed every time.
+    """
+
+    def __init__( self , midi_outports ):
+        """
+            Cache the output paths of this host
+        """
+        super().__init__()
+        self.midi_outports      = midi_outports
+        self.output_suffixes    = tuple(
+                OSC_PATH_DELIMITER + OUTPUT + OSC_PATH_DELIMITER + str( channel )
+                for channel in range( MIDI_CHANNELS )
+                if midi_outports[ channel ]
+                )
+        for osc_path in osc_output_paths():
+            self[ osc_path ]
+
+    def __missing__( self , osc_path ):
+        """
+            Parse a path which is not cached yet, and cache its MIDI outport
+        """
+        midi_outport    = None
+        # Only a path ending in /output/ and a channel with an outport is split
+        if osc_path.endswith( self.output_suffixes ):
+            osc_path_parts  = osc_path.split( OSC_PATH_DELIMITER )
+            if len( osc_path_parts ) == len( FTP_OSC_PATH_INDICES ) and ftp_pickup_index(
+                    osc_path_parts[ FTP_OSC_PATH_INDICES[ "device" ] ]
+                    ) is not None:
+                channel = int( osc_path_parts[ FTP_OSC_PATH_INDICES[ "channel" ] ] )
+                midi_outport    = self.midi_outports[ channel ]
+        if len( self ) < OSC_PATH_CACHE_SIZE:
+            self[ osc_path ]    = midi_outport
+        return midi_outport
+
+
+
+def osc_midi_message(
         osc_path    ,
         osc_midi    ,
         ):
     """
-        Send an OSC Midi message.  This is a tuple of 4 ints.
+        Build a liblo OSC Midi message.  osc_midi is a tuple of 4 ints.
 
         To explicitly send a MIDI message, the *args of the message must be (typetage, data )
             for midi this will be Message( path , ( 'm' ,  midi_tuple  ) )
     """
-    return send(
-            osc_target      ,
-            Message(
-                osc_path                    ,
-                (
-                    OSC_TYPETAGS[ "midi" ]  ,
-                    osc_midi                ,
+    return Message(
+            osc_path                    ,
+            (
+                OSC_TYPETAGS[ "midi" ]  ,
+                osc_midi                ,
+                )
+            )
+
+
+def osc_midi_bundle( osc_messages ):
+    """
+        Build a liblo OSC bundle of OSC Midi messages, timetagged with the current time.
+
+        osc_messages is a list of ( osc_path , osc_midi ) tuples.  A bundle is sent as a
+        single datagram, so the messages in it arrive at the target together.
+        A single message is built without a bundle.
+    """
+    if len( osc_messages ) == ONE:
+        return osc_midi_message(
+                *osc_messages[ ZERO ]
+                )
+    return Bundle(
+            time()  ,
+            *(
+                osc_midi_message(
+                    osc_path    ,
+                    osc_midi    ,
                     )
+                for osc_path , osc_midi in osc_messages
                 )
             )
 
 
+def send_osc_midi( 
+        osc_target  ,
+        osc_path    ,
+        osc_midi    ,
+        ):
+    """
+        Send an OSC Midi message.  This is a tuple of 4 ints.
+    """
+    return send(
+            osc_target                  ,
+            osc_midi_message(
+                osc_path    ,
+                osc_midi    ,
+                )                       ,
+            )
+
+
+def send_osc_bundle(
+        osc_target      ,
+        osc_messages    ,
+        ):
+    """
+        Send a list of OSC Midi messages in one OSC bundle, timetagged with the current time.
+
+        osc_messages is a list of ( osc_path , osc_midi ) tuples.
+    """
+    return send(
+            osc_target                      ,
+            osc_midi_bundle( osc_messages ) ,
+            )
+
+
+def osc_string( string ):
+    """
+        Encode a string as an OSC string, null terminated and padded to 4 bytes.
+    """
+    encoded = string.encode() + OSC_STRING_END
+    return encoded + OSC_STRING_END * ( -len( encoded ) % OSC_ALIGNMENT )
+
+
+def osc_midi_packet(
+        osc_path    ,
+        osc_midi    ,
+        ):
+    """
+        Encode an OSC Midi message as bytes, without liblo.
+
+        This is the same packet liblo sends for Message( osc_path , ( 'm' , osc_midi ) ).
+    """
+    return osc_string( osc_path ) + osc_string(
+            OSC_TYPETAG_PREFIX + OSC_TYPETAGS[ "midi" ]
+            ) + bytes( osc_midi[ : OSC_MIDI_LENGTH ] )
+
+
+def osc_bundle_packet( osc_packets ):
+    """
+        Encode a list of encoded OSC packets as one OSC bundle, timetagged with the
+        current time.
+    """
+    timetag = time()
+    return OSC_BUNDLE_TAG + OSC_TIMETAG_STRUCT.pack(
+            int( timetag )                                              ,
+            int( timetag % ONE * OSC_TIMETAG_FRACTION )                 ,
+            ) + b"".join(
+                    OSC_SIZE_STRUCT.pack( len( osc_packet ) ) + osc_packet
+                    for osc_packet in osc_packets
+                    )
+
+
 def register_ftp_osc_input( osc_server ):
     """
         This method registers all incoming osc messages to methods
@@ -324,3 +650,59 @@ def register_ftp_osc_input( osc_server ):
 
     return
 
+
+
+def register_metrics_osc_query(
+        osc_server          ,
+        metrics             ,
+        midi_pickup = None  ,
+        ):
+    """
+        Register the FTPMetrics OSC query on the osc_server, at the "metrics" input path.
+
+        A message of any type sent to /hostname/tripleplay/input/metrics is replied to
+        with the metrics.  midi_pickup replaces the pickup name in the path.
+    """
+    osc_path_format.update(
+            { 
+                "direction" : INPUT                         ,
+                "channel"   : OSC_INPUT_PATHS[ "metrics" ]  ,
+                }   ,
+            )
+    if midi_pickup:
+        osc_path_format.update(
+                {
+                    "midi_pickup"   : midi_pickup   ,
+                    }   ,
+                )
+    osc_server.add_method(
+            osc_path.format( **osc_path_format )    ,
+            OSC_TYPETAGS[ "any" ]                   ,
+            metrics.osc_query                       ,
+            )
+    return
+
+
+
+def register_reload_osc_input(
+        osc_server      ,
+        reload_config   ,
+        ):
+    """
+        Register reload_config on the osc_server, at the "reload" input path.
+
+        A message of any type sent to /hostname/tripleplay/input/reload reloads the
+        configuration file.
+    """
+    osc_path_format.update(
+            { 
+                "direction" : INPUT                         ,
+                "channel"   : OSC_INPUT_PATHS[ "reload" ]   ,
+                }   ,
+            )
+    osc_server.add_method(
+            osc_path.format( **osc_path_format )    ,
+            OSC_TYPETAGS[ "any" ]                   ,
+            reload_config                           ,
+            )
+    return
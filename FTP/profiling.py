@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Profiling Module
+        ftp.profiling
+
+    Written By:
+        Shane Hutter
+
+        A module for timing each stage of the MIDI to OSC, and OSC to MIDI, hot paths.
+
+        Profiling is off unless enabled by profile in the configuration file, or
+        toggled by sending the daemon SIGUSR1.  While off, the hot path only checks
+        StageProfiler.enabled.  While on, every profile-sample'th message takes the
+        profiled path, which timestamps each stage with perf_counter_ns().
+
+        Turning profiling off prints a summary of every stage, and writes the stage
+        timings as folded stacks, which flamegraph.pl, inferno, and speedscope read.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from os.path    import join
+from time       import perf_counter_ns
+
+
+NANOSECONDS_PER_MICRO   = 1000
+
+PROFILE_DIR     = "/tmp"
+PROFILE_FILE    = "{name}.folded"
+PROFILE_STACK_DELIMITER = ";"
+
+# Stages, as folded stacks below the profiler name
+PROFILE_STAGES  = {
+        "ring put"      : "midi receive;ring put"       ,
+        "queued"        : "osc send;queued"             ,
+        "coalesce"      : "osc send;coalesce"           ,
+        "path lookup"   : "osc send;path lookup"        ,
+        "encode"        : "osc send;encode"             ,
+        "send"          : "osc send;send"               ,
+        "bundle"        : "osc send;bundle"             ,
+        "metrics"       : "osc send;metrics"            ,
+        "osc path"      : "osc2midi;path lookup"        ,
+        "midi send"     : "osc2midi;midi send"          ,
+        }
+
+# Indices of the stage statistics
+STAGE_INDICES   = {
+        "count" : 0 ,
+        "total" : 1 ,
+        "max"   : 2 ,
+        }
+
+profile_stage   = "{stack:<40} {count:>10} samples {mean:>10.1f}us mean {max:>10.1f}us max"
+profile_folded  = "{name};{stack} {total}\n"
+profile_written = "Profile written to {path}"
+
+
+
+class StageProfiler:
+    """
+        Aggregate the time spent in each stage of the hot path, in memory.
+
+        name is the root of every folded stack, such as ftposcd;tripleplay.  Every
+        sample'th call to sample() returns True, so only those messages are profiled.
+        Stage statistics are a list of count, total and maximum nanoseconds, per stage.
+    """
+
+    def __init__(
+            self                        ,
+            name                        ,
+            sample      = ONE           ,
+            profile_dir = PROFILE_DIR   ,
+            ):
+        """
+            Initialize the profiler, disabled
+        """
+        self.name           = name
+        self.enabled        = False
+        self.sample_every   = max(
+                sample  ,
+                ONE     ,
+                )
+        self.countdown      = self.sample_every
+        self.stages         = dict()
+        self.path           = join(
+                profile_dir or PROFILE_DIR  ,
+                PROFILE_FILE.format(
+                    name    = name.replace(
+                        PROFILE_STACK_DELIMITER , "-"   ,
+                        )
+                    )                       ,
+                )
+
+
+    def sample( self ):
+        """
+            Return True for every sample'th message, which should be profiled
+        """
+        self.countdown  -= ONE
+        if self.countdown > ZERO:
+            return False
+        self.countdown  = self.sample_every
+        return True
+
+
+    def mark(
+            self        ,
+            stage       ,
+            start_ns    ,
+            ):
+        """
+            Record the time since start_ns as spent in stage, which is one of the
+            PROFILE_STAGES.
+
+            Return the current perf_counter_ns(), to start the next stage from.
+        """
+        now_ns  = perf_counter_ns()
+        elapsed = now_ns - start_ns
+        stats   = self.stages.get( stage )
+        if stats is None:
+            stats   = self.stages[ stage ]  = [ ZERO , ZERO , ZERO ]
+        stats[ STAGE_INDICES[ "count" ] ]   += ONE
+        stats[ STAGE_INDICES[ "total" ] ]   += elapsed
+        if elapsed > stats[ STAGE_INDICES[ "max" ] ]:
+            stats[ STAGE_INDICES[ "max" ] ] = elapsed
+        return now_ns
+
+
+    def summary( self ):
+        """
+            Return a line per stage, with its sample count, mean and maximum time
+        """
+        return "\n".join(
+                profile_stage.format(
+                    stack   = stack                                                 ,
+                    count   = stats[ STAGE_INDICES[ "count" ] ]                     ,
+                    mean    = stats[ STAGE_INDICES[ "total" ] ]
+                        / stats[ STAGE_INDICES[ "count" ] ]
+                        / NANOSECONDS_PER_MICRO                                     ,
+                    max     = stats[ STAGE_INDICES[ "max" ] ] / NANOSECONDS_PER_MICRO   ,
+                    )
+                for stack , stats in sorted( self.stages.items() )
+                )
+
+
+    def folded( self ):
+        """
+            Return the stage timings as folded stacks, weighted by total nanoseconds
+        """
+        return "".join(
+                profile_folded.format(
+                    name    = self.name                         ,
+                    stack   = stack                             ,
+                    total   = stats[ STAGE_INDICES[ "total" ] ] ,
+                    )
+                for stack , stats in sorted( self.stages.items() )
+                )
+
+
+    def dump( self ):
+        """
+            Write the folded stacks to the profile file, and return its path
+        """
+        with open( self.path , "w" ) as profile_file:
+            profile_file.write( self.folded() )
+        return self.path
+
+
+    def toggle( self , *args ):
+        """
+            SIGUSR1 handler.  Turn profiling on, or turn it off and report it.
+        """
+        if not self.enabled:
+            self.stages     = dict()
+            self.countdown  = self.sample_every
+            self.enabled    = True
+            return
+        self.enabled    = False
+        print( self.summary() )
+        try:
+            print(
+                    profile_written.format( path = self.dump() )
+                    )
+        except OSError as error:
+            print( error )
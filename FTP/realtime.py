@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Realtime Module
+        ftp.realtime
+
+    Written By:
+        Shane Hutter
+
+        A module for running the hot path of ftposcd in real-time mode, on a machine
+        shared with audio software.  Every setting is off unless set in the
+        configuration file:
+            realtime-priority   SCHED_FIFO priority of the hot threads: the rtmidi thread
+                                each MIDI input recieves on, the main thread, which
+                                runs the input loop, and the OSC send stage
+            realtime-cpus       CPUs ftposcd runs on, such as 2,3 or 2-3
+            realtime-mlock      lock every page of ftposcd in memory, so it is never paged out
+            gc-freeze           freeze the objects created by startup, and disable the
+                                garbage collector, collecting only while idle
+
+        A setting which is not permitted, such as a real-time priority without
+        CAP_SYS_NICE or an rtprio limit, is reported, and ftposcd runs without it.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from ctypes     import (
+        CDLL    , get_errno ,
+        )
+from os         import (
+        sched_param , sched_setaffinity , sched_setscheduler    ,
+        SCHED_FIFO  , strerror          ,
+        )
+from sys        import stderr
+from threading  import (
+        Event   , Thread    ,
+        )
+import gc
+
+
+MILLISECONDS            = 1000
+GC_IDLE_INTERVAL        = 100   # milliseconds
+CPU_LIST_DELIMITER      = ","
+CPU_RANGE_DELIMITER     = "-"
+
+# mlockall() flags, from sys/mman.h
+MLOCKALL_FLAGS  = {
+        "current"   : 1 ,
+        "future"    : 2 ,
+        }
+
+realtime_applied    = "realtime: {setting}"
+realtime_failed     = "realtime: {setting} not applied: {error}"
+
+
+
+def report_realtime(
+        setting         ,
+        error   = None  ,
+        ):
+    """
+        Report a setting as applied, or as not applied because of error
+    """
+    if error is None:
+        print( realtime_applied.format( setting = setting ) )
+        return True
+    print(
+            realtime_failed.format(
+                setting = setting   ,
+                error   = error     ,
+                )           ,
+            file = stderr   ,
+            )
+    return False
+
+
+def cpu_list( cpus ):
+    """
+        Return the set of CPUs in a list such as 2,3 or 2-3
+    """
+    cpu_set = set()
+    for cpu_range in str( cpus ).split( CPU_LIST_DELIMITER ):
+        first , separator , last    = cpu_range.partition( CPU_RANGE_DELIMITER )
+        cpu_set.update(
+                range(
+                    int( first )                    ,
+                    int( last or first ) + ONE      ,
+                    )
+                )
+    return cpu_set
+
+
+def realtime_affinity( cpus ):
+    """
+        Run ftposcd, and every thread it starts after, on the CPUs in a cpu_list()
+    """
+    setting = "CPUs {}".format( cpus )
+    try:
+        sched_setaffinity(
+                ZERO                ,
+                cpu_list( cpus )    ,
+                )
+    except ( OSError , ValueError ) as error:
+        return report_realtime(
+                setting ,
+                error   ,
+                )
+    return report_realtime( setting )
+
+
+def realtime_mlock():
+    """
+        Lock every current, and future, page of ftposcd in memory
+    """
+    setting = "mlockall"
+    try:
+        libc    = CDLL(
+                None                ,
+                use_errno   = True  ,
+                )
+        if libc.mlockall(
+                MLOCKALL_FLAGS[ "current" ] | MLOCKALL_FLAGS[ "future" ]
+                ):
+            return report_realtime(
+                    setting                     ,
+                    strerror( get_errno() )     ,
+                    )
+    except ( AttributeError , OSError ) as error:
+        # No C library, or no mlockall() in it
+        return report_realtime(
+                setting ,
+                error   ,
+                )
+    return report_realtime( setting )
+
+
+def realtime_thread(
+        priority                ,
+        report      = False     ,
+        ):
+    """
+        Schedule the calling thread with SCHED_FIFO at priority, 1 to 99.
+
+        Called by each hot thread, as the policy is per thread: the rtmidi thread of
+        every MIDI input opened by FTPDeviceManager, on its first event, and
+        ftposcd's main thread, whose priority the OSC send stage inherits.  Failures
+        are always reported, success only with report, so it is reported once.
+    """
+    setting = "SCHED_FIFO priority {}".format( priority )
+    try:
+        sched_setscheduler(
+                ZERO                    ,
+                SCHED_FIFO              ,
+                sched_param( priority ) ,
+                )
+    except OSError as error:
+        return report_realtime(
+                setting ,
+                error   ,
+                )
+    if report:
+        return report_realtime( setting )
+    return True
+
+
+def gc_freeze():
+    """
+        Move every object created so far to the permanent generation, which the
+        collector never scans, and disable automatic collections.
+    """
+    gc.collect()
+    gc.freeze()
+    gc.disable()
+    return report_realtime(
+            "gc frozen, {} objects".format( gc.get_freeze_count() )
+            )
+
+
+
+class IdleCollector:
+    """
+        Collect garbage only while ftposcd is idle, with automatic collection disabled.
+
+        activity is called every interval milliseconds, and returns a count which
+        changes whenever a message is handled, such as the count of the latency
+        histogram.  If it has not changed for a whole interval, the garbage is
+        collected.  Objects freed by reference counting are freed at once as always,
+        only cycles wait for an idle moment.
+    """
+
+    def __init__(
+            self                                ,
+            activity                            ,
+            interval    = GC_IDLE_INTERVAL      ,
+            ):
+        """
+            interval is in milliseconds
+        """
+        self.activity       = activity
+        self.interval       = ( interval or GC_IDLE_INTERVAL ) / MILLISECONDS
+        self.collections    = ZERO
+        self.collected      = ZERO
+        self.stopped        = Event()
+        self.thread         = Thread(
+                target  = self.run  ,
+                daemon  = True      ,
+                )
+
+
+    def start( self ):
+        """
+            Start collecting
+        """
+        self.thread.start()
+        return self
+
+
+    def run( self ):
+        """
+            Collect whenever there was no activity for an interval, and something to
+            collect.
+        """
+        last_activity   = self.activity()
+        while not self.stopped.wait( self.interval ):
+            activity        = self.activity()
+            if activity == last_activity and any( gc.get_count() ):
+                self.collected      += gc.collect()
+                self.collections    += ONE
+            last_activity   = activity
+
+
+    def stop( self ):
+        """
+            Stop collecting
+        """
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Ring Module
+        ftp.ring
+
+    Written By:
+        Shane Hutter
+
+        A module for the bounded ring buffer between the MIDI receive stage, and
+        the OSC send stage of ftposcd, so the receive stage never waits on the network.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from .midi  import (
+        MIDI_PITCHWHEEL_STATUS  , MIDI_STATUS_INDEX ,
+        )
+from threading  import (
+        Event   , Lock  ,
+        )
+
+
+# Overflow policies, what put() does when the ring is full
+RING_OVERFLOW   = {
+        "drop-oldest"       : "drop-oldest"     ,
+        "drop-pitchwheel"   : "drop-pitchwheel" ,
+        "block"             : "block"           ,
+        }
+RING_CAPACITY   = 1024
+
+
+
+class MIDIRing:
+    """
+        A bounded, single producer, single consumer ring of ( midi_data , received_ns )
+        MIDI messages.
+
+        The MIDI receive stage puts, and the OSC send stage gets.  Slots are preallocated,
+        and the producer only moves head, so putting into a ring with room takes no lock.
+        Tail is moved under a lock, which the producer only contends for when it drops a
+        message from a full ring.
+
+        When the ring is full, overflow selects what put() does:
+            drop-oldest         drop the oldest message
+            drop-pitchwheel     drop the oldest pitchwheel message, as it is superseded by
+                                the newer ones, or the oldest message if there is none
+            block               wait for the send stage to make room
+
+        The ring counts dropped messages, and the high-water mark of its depth.
+    """
+
+    def __init__(
+            self                                        ,
+            capacity    = RING_CAPACITY                 ,
+            overflow    = RING_OVERFLOW[ "drop-oldest" ],
+            ):
+        """
+            Preallocate the slots.  overflow is a key of RING_OVERFLOW.
+        """
+        self.slots      = [ None ] * capacity
+        self.capacity   = capacity
+        self.overflow   = RING_OVERFLOW[ overflow ]
+        self.head       = ZERO  # messages put
+        self.tail       = ZERO  # messages taken
+        self.high_water = ZERO
+        self.dropped    = ZERO
+        self.closed     = False
+        self.lock       = Lock()
+        self.not_empty  = Event()
+        self.not_full   = Event()
+
+
+    def depth( self ):
+        """
+            Return the number of messages in the ring
+        """
+        return self.head - self.tail
+
+
+    def put(
+            self        ,
+            midi_data   ,
+            received_ns ,
+            ):
+        """
+            Add a message to the ring.  Only called by the receive stage.
+        """
+        depth   = self.head - self.tail
+        if depth >= self.capacity:
+            if self.overflow == RING_OVERFLOW[ "block" ]:
+                self.wait_not_full()
+            else:
+                self.drop()
+            depth   = self.head - self.tail
+            if depth >= self.capacity:
+                # Closed while blocked
+                self.dropped    += ONE
+                return
+
+        self.slots[ self.head % self.capacity ] = (
+                midi_data   ,
+                received_ns ,
+                )
+        self.head   += ONE
+        if depth >= self.high_water:
+            self.high_water = depth + ONE
+        if not self.not_empty.is_set():
+            # The send stage clears the event before waiting on it
+            self.not_empty.set()
+
+
+    def drop( self ):
+        """
+            Remove one message from a full ring, chosen by the overflow policy.
+        """
+        with self.lock:
+            if self.head - self.tail < self.capacity:
+                # The send stage made room meanwhile
+                return
+            dropped = self.tail
+            if self.overflow == RING_OVERFLOW[ "drop-pitchwheel" ]:
+                for index in range( self.tail , self.head ):
+                    if self.slots[ index % self.capacity ][ ZERO ][
+                            MIDI_STATUS_INDEX
+                            ] in MIDI_PITCHWHEEL_STATUS:
+                        dropped = index
+                        break
+            # Close the gap, moving every older message up one slot
+            for index in range( dropped , self.tail , -ONE ):
+                self.slots[ index % self.capacity ] = self.slots[
+                        ( index - ONE ) % self.capacity
+                        ]
+            self.slots[ self.tail % self.capacity ] = None
+            self.tail       += ONE
+            self.dropped    += ONE
+
+
+    def wait_not_full( self ):
+        """
+            Wait for the send stage to take a message from a full ring
+        """
+        while self.head - self.tail >= self.capacity and not self.closed:
+            self.not_full.clear()
+            if self.head - self.tail < self.capacity:
+                return
+            self.not_full.wait()
+
+
+    def poll( self ):
+        """
+            Return the oldest ( midi_data , received_ns ) message, or None if the ring
+            is empty.  Only called by the send stage.
+        """
+        with self.lock:
+            if self.tail == self.head:
+                return None
+            index       = self.tail % self.capacity
+            message     = self.slots[ index ]
+            self.slots[ index ] = None
+            self.tail   += ONE
+        if not self.not_full.is_set():
+            self.not_full.set()
+        return message
+
+
+    def get(
+            self            ,
+            timeout = None  ,
+            ):
+        """
+            Wait for, and return, the oldest ( midi_data , received_ns ) message.
+
+            Return None once the ring is closed, or after waiting timeout seconds.
+        """
+        while True:
+            message = self.poll()
+            if message is not None or self.closed:
+                return message
+            self.not_empty.clear()
+            if self.tail == self.head and not self.closed:
+                if not self.not_empty.wait( timeout ):
+                    return None
+
+
+    def iter_pending( self ):
+        """
+            Iterate through the messages in the ring, without waiting
+        """
+        while True:
+            message = self.poll()
+            if message is None:
+                return
+            yield message
+
+
+    def close( self ):
+        """
+            Wake the send stage, and a blocked receive stage, so they can stop
+        """
+        self.closed = True
+        self.not_empty.set()
+        self.not_full.set()
@@ -0,0 +1,790 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Sender Module
+        ftp.sender
+
+    Written By:
+        Shane Hutter
+
+        A module for the OSC senders, which send converted MIDI messages to the
+        OSC targets.  The sender is selected with osc-sender in the configuration file.
+
+        Every sender is created with the OSC output paths from osc_output_paths(),
+        and a list of ( host , port , transport ) OSC targets, and has the same methods:
+            send_midi       send a list of MIDI bytes, from the MIDI input, as OSC Midi
+            send_midi_profiled  send_midi, timing each stage with a StageProfiler
+            send_bundle     send a list of MIDI byte lists as one OSC bundle
+            retarget        replace the OSC targets, while sending
+            close           release the sender's socket
+
+        Every sender counts the packets it sent, dropped, and failed to send, per target.
+
+        The transports of FTP.transport each sender can send over are in its
+        transports.  Only the socket sender sends over TCP.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from .midi  import (
+        midi_data_tuple , MIDI_STATUS_INDEX ,
+        )
+from .config    import osc_targets
+from .profiling import PROFILE_STAGES
+from .osc   import (
+        osc_bundle_packet   , osc_status_paths  ,
+        osc_midi_bundle     , osc_midi_message  ,
+        OSCMidiEncoder      ,
+        )
+from .transport import (
+        osc_socket              , osc_target_name   , slip_encode   ,
+        OSC_STREAM_TRANSPORTS   , OSC_TRANSPORTS    ,
+        )
+from abc        import (
+        ABC , abstractmethod    ,
+        )
+from asyncio    import (
+        DatagramProtocol    , new_event_loop    , run_coroutine_threadsafe  ,
+        )
+from errno      import (
+        EAGAIN  , ENOBUFS   , EWOULDBLOCK   ,
+        )
+from liblo      import (
+        Address , AddressError  , send  ,
+        )
+from sys        import exit
+from threading  import Thread
+from time       import perf_counter_ns
+
+
+# Errors which mean the packet was dropped because the socket buffer was full
+SEND_DROP_ERRNOS    = (
+        EAGAIN  , ENOBUFS   , EWOULDBLOCK   ,
+        )
+
+TCP_RECONNECT_INTERVAL  = 1000000000  # nanoseconds between attempts to reopen a TCP target
+
+LIBLO_UNIX_URL  = "osc.unix://{path}"
+
+
+def encoded_packets(
+        encoder         ,
+        midi_messages   ,
+        ):
+    """
+        Encode a list of MIDI byte lists with an OSCMidiEncoder, copying each packet
+        so they can be bundled.  MIDI data which does not fit OSC Midi is skipped.
+    """
+    osc_packets = list()
+    for midi_data in midi_messages:
+        osc_packet  = encoder.encode( midi_data )
+        if osc_packet is not None:
+            osc_packets.append(
+                    bytes( osc_packet )
+                    )
+    return osc_packets
+
+
+
+class OSCTarget:
+    """
+        One OSC target of a sender, with its own counters of packets sent, dropped,
+        and failed to send.
+    """
+
+    def __init__(
+            self                                    ,
+            osc_host                                ,
+            osc_port                                ,
+            transport   = OSC_TRANSPORTS[ "udp" ]   ,
+            ):
+        """
+            Initialize the counters.  Senders keep their connection to the target
+            in connection, and the unsent end of a frame to a stream target in
+            pending.
+        """
+        self.host       = osc_host
+        self.port       = osc_port
+        self.transport  = transport
+        self.name       = osc_target_name(
+                osc_host    ,
+                osc_port    ,
+                transport   ,
+                )
+        self.stream     = transport in OSC_STREAM_TRANSPORTS
+        self.connection = None
+        self.pending    = bytes()
+        self.reconnect_ns   = ZERO
+        self.sent       = ZERO
+        self.dropped    = ZERO
+        self.errors     = ZERO
+
+
+    def count_error( self , error ):
+        """
+            Count a full socket buffer as a dropped packet, anything else as an error.
+        """
+        if error.errno in SEND_DROP_ERRNOS:
+            self.dropped    += ONE
+        else:
+            self.errors     += ONE
+
+
+
+class OSCSender( ABC ):
+    """
+        Shared by every sender.  Creates an OSCTarget for every ( host , port ) or
+        ( host , port , transport ) in osc_targets, and totals their counters.
+
+        Every message is encoded once, and the same packet is sent to every target.
+    """
+
+    transports  = (
+            OSC_TRANSPORTS[ "udp" ]     ,
+            )
+
+    def __init__(
+            self        ,
+            osc_targets ,
+            ):
+        """
+            Create the targets, and the counter of messages which could not be encoded
+        """
+        self.targets        = [
+                OSCTarget( *osc_target )
+                for osc_target in osc_targets
+                ]
+        self.unencodable    = ZERO
+
+
+    @property
+    def sent( self ):
+        """
+            Packets sent, to all targets
+        """
+        return sum( target.sent for target in self.targets )
+
+
+    @property
+    def dropped( self ):
+        """
+            Packets dropped, for all targets
+        """
+        return sum( target.dropped for target in self.targets )
+
+
+    @property
+    def errors( self ):
+        """
+            Messages which could not be encoded, and packets which failed to send
+        """
+        return self.unencodable + sum( target.errors for target in self.targets )
+
+
+    @abstractmethod
+    def connect(
+            self        ,
+            target      ,
+            osc_sndbuf  ,
+            ):
+        """
+            Return the connection of a sender to an OSCTarget, defined by every sender
+        """
+
+
+    def disconnect( self , target ):
+        """
+            Close the connection of a sender to an OSCTarget
+        """
+        return
+
+
+    def retarget(
+            self            ,
+            osc_targets     ,
+            osc_sndbuf = 0  ,
+            ):
+        """
+            Replace the targets with a new list of ( host , port , transport ) OSC
+            targets.
+
+            Targets which are kept keep their connection and counters.  New targets
+            are connected before the targets list is replaced, in one assignment, so
+            a message being sent goes to either all of the old, or all of the new
+            targets.  Removed targets are disconnected after.
+        """
+        current_targets = {
+                (
+                    target.host         ,
+                    target.port         ,
+                    target.transport    ,
+                    )   : target
+                for target in self.targets
+                }
+        targets = list()
+        for osc_target in osc_targets:
+            target  = OSCTarget( *osc_target )
+            target  = current_targets.pop(
+                    (
+                        target.host         ,
+                        target.port         ,
+                        target.transport    ,
+                        )   ,
+                    target  ,
+                    )
+            if target.connection is None:
+                target.connection   = self.connect(
+                        target      ,
+                        osc_sndbuf  ,
+                        )
+            targets.append( target )
+        self.targets    = targets
+        for target in current_targets.values():
+            self.disconnect( target )
+
+
+
+class LibloSender( OSCSender ):
+    """
+        Send OSC through liblo, building a liblo Message for every event.
+
+        This is the default sender.  liblo sends are blocking, so use the socket or
+        asyncio sender to keep a slow target from delaying the others.
+    """
+
+    transports  = (
+            OSC_TRANSPORTS[ "udp" ]     ,
+            OSC_TRANSPORTS[ "unix" ]    ,
+            )
+
+    def __init__(
+            self            ,
+            osc_paths       ,
+            osc_targets     ,
+            osc_sndbuf = 0  ,
+            ):
+        """
+            Create the liblo Address of every OSC target, exiting if one can not be
+            resolved.
+
+            liblo does not expose its socket, so osc_sndbuf is ignored.
+        """
+        super().__init__( osc_targets )
+        self.osc_paths  = osc_status_paths( osc_paths )
+        for target in self.targets:
+            try:
+                target.connection   = self.connect(
+                        target      ,
+                        osc_sndbuf  ,
+                        )
+            except AddressError as error:
+                # Log errors instead
+                exit( error )
+
+
+    def connect(
+            self        ,
+            target      ,
+            osc_sndbuf  ,
+            ):
+        """
+            Return the liblo Address of the target, raising AddressError if it can not
+            be resolved.
+        """
+        if target.transport == OSC_TRANSPORTS[ "unix" ]:
+            return Address(
+                    LIBLO_UNIX_URL.format( path = target.host )
+                    )
+        return Address(
+                target.host ,
+                target.port ,
+                )
+
+
+    def send( self , osc_message ):
+        """
+            Send a liblo Message or Bundle to every target
+        """
+        for target in self.targets:
+            try:
+                send(
+                        target.connection   ,
+                        osc_message         ,
+                        )
+                target.sent     += ONE
+            except OSError:
+                target.errors   += ONE
+
+
+    def send_midi( self , midi_data ):
+        """
+            Send one OSC Midi message
+        """
+        self.send(
+                osc_midi_message(
+                    self.osc_paths[ midi_data[ MIDI_STATUS_INDEX ] ],
+                    midi_data_tuple( midi_data )                    ,
+                    )
+                )
+
+
+    def send_midi_profiled(
+            self        ,
+            midi_data   ,
+            profiler    ,
+            ):
+        """
+            send_midi(), timing each stage with a StageProfiler.
+
+            Return perf_counter_ns() at the end of the last stage.
+        """
+        start_ns    = perf_counter_ns()
+        osc_path    = self.osc_paths[ midi_data[ MIDI_STATUS_INDEX ] ]
+        osc_midi    = midi_data_tuple( midi_data )
+        start_ns    = profiler.mark(
+                PROFILE_STAGES[ "path lookup" ] ,
+                start_ns                        ,
+                )
+        osc_message = osc_midi_message(
+                osc_path    ,
+                osc_midi    ,
+                )
+        start_ns    = profiler.mark(
+                PROFILE_STAGES[ "encode" ]  ,
+                start_ns                    ,
+                )
+        self.send( osc_message )
+        return profiler.mark(
+                PROFILE_STAGES[ "send" ]    ,
+                start_ns                    ,
+                )
+
+
+    def send_bundle( self , midi_messages ):
+        """
+            Send a list of OSC Midi messages as one OSC bundle
+        """
+        self.send(
+                osc_midi_bundle(
+                    [
+                        (
+                            self.osc_paths[ midi_data[ MIDI_STATUS_INDEX ] ],
+                            midi_data_tuple( midi_data )                    ,
+                            )
+                        for midi_data in midi_messages
+                        ]
+                    )
+                )
+
+
+    def close( self ):
+        """
+            liblo sends without keeping a socket open, nothing to close.
+        """
+        return
+
+
+
+class OSCDatagramProtocol( DatagramProtocol ):
+    """
+        asyncio protocol for an AsyncioSender target socket, counting send errors.
+    """
+
+    def __init__( self , target ):
+        """
+            Keep the target, so its counters can be updated
+        """
+        self.target = target
+
+
+    def error_received( self , error ):
+        """
+            Errors are counted, instead of raised, so the MIDI loop is never stalled.
+        """
+        self.target.count_error( error )
+
+
+
+class AsyncioSender( OSCSender ):
+    """
+        Send OSC over one long lived, non-blocking UDP or Unix datagram socket per
+        target, owned by an asyncio event loop running in its own thread.
+
+        Packets are encoded in the MIDI thread, and handed to the event loop to be
+        sent, so a full socket buffer or a network error never blocks the MIDI loop.
+        Packets which can not be sent right away are dropped and counted, rather than
+        queued behind the socket, so a slow target does not delay the others.
+    """
+
+    transports  = (
+            OSC_TRANSPORTS[ "udp" ]     ,
+            OSC_TRANSPORTS[ "unix" ]    ,
+            )
+
+    def __init__(
+            self            ,
+            osc_paths       ,
+            osc_targets     ,
+            osc_sndbuf = 0  ,
+            ):
+        """
+            Open the sockets, and start the event loop thread.
+
+            osc_sndbuf sets SO_SNDBUF on the sockets, 0 keeps the system default.
+        """
+        super().__init__( osc_targets )
+        self.encoder    = OSCMidiEncoder( osc_paths )
+
+        # Hand a connected, non-blocking socket per target to the event loop
+        self.loop   = new_event_loop()
+        for target in self.targets:
+            target.connection , protocol    = self.loop.run_until_complete(
+                    self.datagram_endpoint(
+                        target      ,
+                        osc_sndbuf  ,
+                        )
+                    )
+        self.thread = Thread(
+                target  = self.loop.run_forever ,
+                daemon  = True                  ,
+                )
+        self.thread.start()
+
+
+    def datagram_endpoint(
+            self        ,
+            target      ,
+            osc_sndbuf  ,
+            ):
+        """
+            Return a coroutine creating the event loop's transport to the target
+        """
+        return self.loop.create_datagram_endpoint(
+                lambda: OSCDatagramProtocol( target )   ,
+                sock = osc_socket(
+                    target.host         ,
+                    target.port         ,
+                    target.transport    ,
+                    osc_sndbuf          ,
+                    )                                   ,
+                )
+
+
+    def connect(
+            self        ,
+            target      ,
+            osc_sndbuf  ,
+            ):
+        """
+            Return a transport to the target, created by the running event loop
+        """
+        transport , protocol    = run_coroutine_threadsafe(
+                self.datagram_endpoint(
+                    target      ,
+                    osc_sndbuf  ,
+                    )           ,
+                self.loop       ,
+                ).result()
+        return transport
+
+
+    def disconnect( self , target ):
+        """
+            Close the transport to the target, from the event loop thread, so it is
+            not closed while sending.
+        """
+        self.loop.call_soon_threadsafe( target.connection.close )
+
+
+    def sendto( self , osc_packet ):
+        """
+            Send an encoded OSC packet to every target, from the event loop thread.
+        """
+        for target in self.targets:
+            if target.connection.get_write_buffer_size():
+                # The socket would block, drop instead of queueing behind it
+                target.dropped  += ONE
+                continue
+            target.connection.sendto( osc_packet )
+            target.sent += ONE
+
+
+    def send_midi( self , midi_data ):
+        """
+            Send one OSC Midi message
+
+            The encoded packet is copied, as the event loop sends it after the encoder
+            may have been reused.
+        """
+        osc_packet  = self.encoder.encode( midi_data )
+        if osc_packet is None:
+            self.unencodable    += ONE
+            return
+        self.loop.call_soon_threadsafe(
+                self.sendto             ,
+                bytes( osc_packet )     ,
+                )
+
+
+    def send_midi_profiled(
+            self        ,
+            midi_data   ,
+            profiler    ,
+            ):
+        """
+            send_midi(), timing each stage with a StageProfiler.  The send stage is
+            the hand off to the event loop.
+
+            Return perf_counter_ns() at the end of the last stage.
+        """
+        start_ns    = perf_counter_ns()
+        osc_packet  = self.encoder.encode( midi_data )
+        start_ns    = profiler.mark(
+                PROFILE_STAGES[ "encode" ]  ,
+                start_ns                    ,
+                )
+        if osc_packet is None:
+            self.unencodable    += ONE
+            return start_ns
+        self.loop.call_soon_threadsafe(
+                self.sendto             ,
+                bytes( osc_packet )     ,
+                )
+        return profiler.mark(
+                PROFILE_STAGES[ "send" ]    ,
+                start_ns                    ,
+                )
+
+
+    def send_bundle( self , midi_messages ):
+        """
+            Send a list of OSC Midi messages as one OSC bundle
+        """
+        self.loop.call_soon_threadsafe(
+                self.sendto                             ,
+                osc_bundle_packet(
+                    encoded_packets(
+                        self.encoder    ,
+                        midi_messages   ,
+                        )
+                    )                                   ,
+                )
+
+
+    def close( self ):
+        """
+            Close the sockets, and stop the event loop thread.
+        """
+        for target in self.targets:
+            self.loop.call_soon_threadsafe( target.connection.close )
+        self.loop.call_soon_threadsafe( self.loop.stop )
+        self.thread.join()
+        self.loop.close()
+
+
+
+class SocketSender( OSCSender ):
+    """
+        Send OSC over one long lived, non-blocking socket per target, from the MIDI
+        thread, over any transport.
+
+        Messages are encoded once with an OSCMidiEncoder, and its memoryview is sent
+        on every datagram target's socket directly, so sending a message allocates
+        nothing.  Packets which can not be sent right away are dropped and counted,
+        so a slow or unreachable target does not delay the others.
+
+        TCP targets are sent the packet SLIP framed, encoded once for all of them.
+        When the socket only takes part of a frame, the rest is kept, and sent
+        before the next frame, so the stream is delayed rather than corrupted.  A
+        frame is only dropped whole, while the end of the one before can not be
+        sent.  A TCP connection which fails is reopened, at most every
+        TCP_RECONNECT_INTERVAL, and starts at a frame boundary.
+    """
+
+    transports  = tuple( OSC_TRANSPORTS.values() )
+
+    def __init__(
+            self            ,
+            osc_paths       ,
+            osc_targets     ,
+            osc_sndbuf = 0  ,
+            ):
+        """
+            Open the sockets.
+
+            osc_sndbuf sets SO_SNDBUF on the sockets, 0 keeps the system default.
+        """
+        super().__init__( osc_targets )
+        self.encoder    = OSCMidiEncoder( osc_paths )
+        self.osc_sndbuf = osc_sndbuf
+        for target in self.targets:
+            target.connection   = self.connect(
+                    target      ,
+                    osc_sndbuf  ,
+                    )
+
+
+    def connect(
+            self        ,
+            target      ,
+            osc_sndbuf  ,
+            ):
+        """
+            Return a non-blocking socket, connected, or connecting, to the target
+        """
+        return osc_socket(
+                target.host         ,
+                target.port         ,
+                target.transport    ,
+                osc_sndbuf          ,
+                )
+
+
+    def reconnect( self , target ):
+        """
+            Reopen the connection to a stream target after it failed, at most every
+            TCP_RECONNECT_INTERVAL.  While it can not be reopened, the failed
+            connection is kept, and sends to it keep being counted as errors.
+        """
+        now_ns  = perf_counter_ns()
+        if now_ns < target.reconnect_ns:
+            return
+        target.reconnect_ns = now_ns + TCP_RECONNECT_INTERVAL
+        try:
+            connection  = self.connect(
+                    target          ,
+                    self.osc_sndbuf ,
+                    )
+        except OSError:
+            return
+        target.connection.close()
+        target.connection   = connection
+        target.pending      = bytes()
+
+
+    def disconnect( self , target ):
+        """
+            Close the socket to the target.  A send already under way on it fails,
+            and is counted by the removed target.
+        """
+        target.connection.close()
+
+
+    def send( self , osc_packet ):
+        """
+            Send an encoded OSC packet to every target, counting instead of raising errors.
+        """
+        slip_packet = None
+        targets     = self.targets
+        index       = ZERO
+        # Indexed, as iterating the targets allocates an iterator for every packet
+        while index < len( targets ):
+            target  = targets[ index ]
+            index   += ONE
+            try:
+                if target.stream:
+                    slip_packet = slip_packet or slip_encode( osc_packet )
+                    if target.pending:
+                        # Finish the frame before, or drop this one whole
+                        sent    = target.connection.send( target.pending )
+                        target.pending  = target.pending[ sent : ]
+                        if target.pending:
+                            target.dropped  += ONE
+                            continue
+                    sent    = target.connection.send( slip_packet )
+                    if not sent:
+                        target.dropped  += ONE
+                        continue
+                    target.pending  = slip_packet[ sent : ]
+                else:
+                    target.connection.send( osc_packet )
+                target.sent += ONE
+            except OSError as error:
+                target.count_error( error )
+                if target.stream and error.errno not in SEND_DROP_ERRNOS:
+                    self.reconnect( target )
+
+
+    def send_midi( self , midi_data ):
+        """
+            Send one OSC Midi message
+        """
+        osc_packet  = self.encoder.encode( midi_data )
+        if osc_packet is None:
+            self.unencodable    += ONE
+            return
+        self.send( osc_packet )
+
+
+    def send_midi_profiled(
+            self        ,
+            midi_data   ,
+            profiler    ,
+            ):
+        """
+            send_midi(), timing each stage with a StageProfiler.
+
+            Return perf_counter_ns() at the end of the last stage.
+        """
+        start_ns    = perf_counter_ns()
+        osc_packet  = self.encoder.encode( midi_data )
+        start_ns    = profiler.mark(
+                PROFILE_STAGES[ "encode" ]  ,
+                start_ns                    ,
+                )
+        if osc_packet is None:
+            self.unencodable    += ONE
+            return start_ns
+        self.send( osc_packet )
+        return profiler.mark(
+                PROFILE_STAGES[ "send" ]    ,
+                start_ns                    ,
+                )
+
+
+    def send_bundle( self , midi_messages ):
+        """
+            Send a list of OSC Midi messages as one OSC bundle
+        """
+        self.send(
+                osc_bundle_packet(
+                    encoded_packets(
+                        self.encoder    ,
+                        midi_messages   ,
+                        )
+                    )
+                )
+
+
+    def close( self ):
+        """
+            Close the sockets.
+        """
+        for target in self.targets:
+            target.connection.close()
+
+
+
+OSC_SENDERS = {
+        "liblo"     : LibloSender   ,
+        "asyncio"   : AsyncioSender ,
+        "socket"    : SocketSender  ,
+        }
+
+
+def osc_sender(
+        config_data ,
+        osc_paths   ,
+        ):
+    """
+        Create the OSC sender selected by osc-sender in the configuration file,
+        targeting every OSC target returned by osc_targets()
+
+        osc_paths are the OSC output paths, as returned by osc_output_paths()
+    """
+    return OSC_SENDERS[ config_data[ "osc-sender" ] ](
+            osc_paths                       ,
+            osc_targets( config_data )      ,
+            config_data[ "osc-sndbuf" ]     ,
+            )
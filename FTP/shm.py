@@ -0,0 +1,580 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Shared Memory Module
+        ftp.shm
+
+    Written By:
+        Shane Hutter
+
+        A module for the same host fast path from ftposcd to ftposc2midi, skipping
+        the OSC encode, the socket, and the liblo decode of every message.
+
+        ftposcd writes every MIDI message into a SharedMIDIRing, a ring of fixed size
+        records in an anonymous shared memory file, and counts up an eventfd after
+        each one.  ftposc2midi listens on a Unix socket, at ftposc2midi-shm, for each
+        Tripleplay of ftposcd to pass it both file descriptors, with send_fds(), and
+        waits on the eventfds of every ring it was passed.  ftposcd only writes into
+        a ring once ftposc2midi acknowledges it, so no message is skipped.
+
+        Each ring has one producer, which only writes head, and one consumer, which
+        only writes tail.  A record is written before head is moved past it.
+
+        Ring layout:
+            header      magic, version, and capacity in records
+            head        records written, in its own cache line
+            tail        records read, in its own cache line
+            records     capacity records of:
+                received_ns     perf_counter_ns() when the message was recieved,
+                                CLOCK_MONOTONIC, so it is the same clock in both daemons
+                channel         MIDI channel, or MIDI_NO_CHANNEL
+                length          number of MIDI bytes, 1 to 4
+                data            the MIDI bytes, zero padded
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from .midi  import midi_status_channels
+from mmap       import mmap
+from os         import (
+        close   , eventfd   , eventfd_read  , eventfd_write , fstat ,
+        ftruncate   , memfd_create  , remove    ,
+        EFD_CLOEXEC , EFD_NONBLOCK  , MFD_CLOEXEC   ,
+        )
+from os.path    import exists
+from selectors  import (
+        DefaultSelector , EVENT_READ    ,
+        )
+from socket     import (
+        recv_fds    , send_fds  , socket    ,
+        AF_UNIX     , SHUT_RDWR , SOCK_STREAM   ,
+        )
+from struct     import Struct
+from sys        import stderr
+from threading  import (
+        Event   , Thread    ,
+        )
+
+
+SHM_RING_MAGIC      = b"FTPRING\0"
+SHM_RING_VERSION    = 1
+SHM_RING_CAPACITY   = 4096  # records
+SHM_RING_NAME       = "ftposcd-ring"
+SHM_MIDI_BYTES      = 4
+SHM_RING_HEADER     = Struct( "<8sII" )    # magic , version , capacity
+SHM_RING_COUNTER    = Struct( "<Q" )
+SHM_RING_RECORD     = Struct( "<qBB4s2x" ) # received_ns , channel , length , data
+SHM_RING_OFFSETS    = {
+        "header"    : 0     ,
+        "head"      : 64    ,
+        "tail"      : 128   ,
+        "records"   : 192   ,
+        }
+SHM_RING_FDS        = 2     # the shared memory file, and the eventfd
+SHM_HELLO_SIZE      = 256   # bytes of the name sent with the file descriptors
+SHM_RING_ACK        = b"\x06"    # sent back once ftposc2midi reads the ring
+SHM_CONNECT_INTERVAL    = 1 # seconds between attempts to reach ftposc2midi
+SHM_LISTEN_BACKLOG  = 8
+
+shm_ring_connected      = "{name}: shared ring connected to {path}"
+shm_ring_disconnected   = "{name}: shared ring disconnected from {path}"
+shm_ring_invalid        = "shared ring from {name} rejected: not a version {version} ring"
+
+
+
+def shm_ring_size( capacity ):
+    """
+        Return the size in bytes of a ring of capacity records
+    """
+    return SHM_RING_OFFSETS[ "records" ] + capacity * SHM_RING_RECORD.size
+
+
+def shm_record_offset(
+        index       ,
+        capacity    ,
+        ):
+    """
+        Return the offset in the ring of the record written index-th
+    """
+    return SHM_RING_OFFSETS[ "records" ] + index % capacity * SHM_RING_RECORD.size
+
+
+
+class SharedMIDIRing:
+    """
+        The producer side of a shared ring, written by one Tripleplay of ftposcd.
+
+        A watcher thread keeps the ring passed to ftposc2midi at path, reconnecting
+        when it is restarted.  While it is not connected, put() does nothing.  When
+        the ring is full, the newest message is dropped, and counted, as only the
+        consumer may move tail.
+    """
+
+    def __init__(
+            self                                ,
+            path                                ,
+            name                                ,
+            capacity    = SHM_RING_CAPACITY     ,
+            ):
+        """
+            Create the shared memory, and the eventfd.  name identifies the producer
+            to ftposc2midi, such as the pickup name.
+        """
+        self.path       = path
+        self.name       = name
+        self.capacity   = capacity
+        self.memfd      = memfd_create(
+                SHM_RING_NAME   ,
+                MFD_CLOEXEC     ,
+                )
+        ftruncate(
+                self.memfd                  ,
+                shm_ring_size( capacity )   ,
+                )
+        self.buffer     = mmap(
+                self.memfd                  ,
+                shm_ring_size( capacity )   ,
+                )
+        SHM_RING_HEADER.pack_into(
+                self.buffer                         ,
+                SHM_RING_OFFSETS[ "header" ]        ,
+                SHM_RING_MAGIC                      ,
+                SHM_RING_VERSION                    ,
+                capacity                            ,
+                )
+        self.eventfd    = eventfd(
+                ZERO                        ,
+                EFD_CLOEXEC | EFD_NONBLOCK  ,
+                )
+        self.channels   = midi_status_channels()
+        self.head       = ZERO
+        self.sent       = ZERO
+        self.dropped    = ZERO
+        self.connected  = False
+        self.connection = None
+        self.stopped    = Event()
+        self.watcher    = Thread(
+                target  = self.watch    ,
+                daemon  = True          ,
+                )
+
+
+    def __enter__( self ):
+        """
+            Start passing the ring to ftposc2midi
+        """
+        return self.start()
+
+
+    def start( self ):
+        """
+            Start passing the ring to ftposc2midi
+        """
+        self.watcher.start()
+        return self
+
+
+    def __exit__(
+            self        ,
+            *exception  ,
+            ):
+        """
+            Stop, and release the ring
+        """
+        return self.close()
+
+
+    def watch( self ):
+        """
+            Pass the ring to ftposc2midi, and wait for it to hang up, until closed
+        """
+        while not self.stopped.is_set():
+            connection  = socket(
+                    AF_UNIX     ,
+                    SOCK_STREAM ,
+                    )
+            try:
+                connection.connect( self.path )
+                send_fds(
+                        connection                      ,
+                        [ self.name.encode() ]          ,
+                        [ self.memfd , self.eventfd ]   ,
+                        )
+            except OSError:
+                connection.close()
+                self.stopped.wait( SHM_CONNECT_INTERVAL )
+                continue
+            self.connection = connection
+            try:
+                acknowledged    = connection.recv( ONE ) == SHM_RING_ACK
+            except OSError:
+                acknowledged    = False
+            if not acknowledged:
+                # Rejected, or ftposc2midi stopped before reading the ring
+                connection.close()
+                self.stopped.wait( SHM_CONNECT_INTERVAL )
+                continue
+            self.connected  = True
+            print(
+                    shm_ring_connected.format(
+                        name    = self.name ,
+                        path    = self.path ,
+                        )
+                    )
+            try:
+                # ftposc2midi never sends, this returns when it hangs up
+                connection.recv( ONE )
+            except OSError:
+                pass
+            self.connected  = False
+            connection.close()
+            if not self.stopped.is_set():
+                print(
+                        shm_ring_disconnected.format(
+                            name    = self.name ,
+                            path    = self.path ,
+                            )
+                        )
+
+
+    def put(
+            self        ,
+            midi_data   ,
+            received_ns ,
+            ):
+        """
+            Write a message into the ring, and wake ftposc2midi.  Only called by the
+            MIDI receive stage.
+        """
+        if not self.connected:
+            return
+        length  = len( midi_data )
+        tail    = SHM_RING_COUNTER.unpack_from(
+                self.buffer                 ,
+                SHM_RING_OFFSETS[ "tail" ]  ,
+                )[ ZERO ]
+        if self.head - tail >= self.capacity or length > SHM_MIDI_BYTES:
+            self.dropped    += ONE
+            return
+        SHM_RING_RECORD.pack_into(
+                self.buffer                                 ,
+                shm_record_offset(
+                    self.head       ,
+                    self.capacity   ,
+                    )                                       ,
+                received_ns                                 ,
+                self.channels[ midi_data[ ZERO ] ]          ,
+                length                                      ,
+                bytes( midi_data )                          ,
+                )
+        self.head   += ONE
+        SHM_RING_COUNTER.pack_into(
+                self.buffer                 ,
+                SHM_RING_OFFSETS[ "head" ]  ,
+                self.head                   ,
+                )
+        eventfd_write(
+                self.eventfd    ,
+                ONE             ,
+                )
+        self.sent   += ONE
+
+
+    def close( self ):
+        """
+            Stop the watcher, and release the ring
+        """
+        self.stopped.set()
+        connection  = self.connection
+        if connection:
+            try:
+                connection.shutdown( SHUT_RDWR )
+            except OSError:
+                pass
+        if self.watcher.is_alive():
+            self.watcher.join()
+        self.buffer.close()
+        close( self.memfd )
+        close( self.eventfd )
+
+
+
+class SharedRingReader:
+    """
+        The consumer side of one shared ring, passed to ftposc2midi by one Tripleplay
+        of ftposcd.
+    """
+
+    def __init__(
+            self        ,
+            connection  ,
+            name        ,
+            memfd       ,
+            eventfd     ,
+            ):
+        """
+            Map the ring, raising ValueError if it is not a ring of this version.
+            Messages written before it was passed are skipped.
+        """
+        self.connection = connection
+        self.name       = name
+        self.eventfd    = eventfd
+        try:
+            self.buffer     = mmap(
+                    memfd                   ,
+                    fstat( memfd ).st_size  ,
+                    )
+        finally:
+            close( memfd )
+        magic , version , self.capacity = SHM_RING_HEADER.unpack_from(
+                self.buffer                     ,
+                SHM_RING_OFFSETS[ "header" ]    ,
+                )
+        if magic != SHM_RING_MAGIC or version != SHM_RING_VERSION or len(
+                self.buffer
+                ) < shm_ring_size( self.capacity ):
+            self.close()
+            raise ValueError(
+                    shm_ring_invalid.format(
+                        name    = name              ,
+                        version = SHM_RING_VERSION  ,
+                        )
+                    )
+        self.tail       = self.head()
+        self.write_tail()
+
+
+    def head( self ):
+        """
+            Return the number of records written by ftposcd
+        """
+        return SHM_RING_COUNTER.unpack_from(
+                self.buffer                 ,
+                SHM_RING_OFFSETS[ "head" ]  ,
+                )[ ZERO ]
+
+
+    def write_tail( self ):
+        """
+            Hand the records read back to ftposcd
+        """
+        SHM_RING_COUNTER.pack_into(
+                self.buffer                 ,
+                SHM_RING_OFFSETS[ "tail" ]  ,
+                self.tail                   ,
+                )
+
+
+    def drain( self , handler ):
+        """
+            Call handler with the ( channel , midi_data , received_ns ) of every record
+            written since the last drain
+        """
+        try:
+            eventfd_read( self.eventfd )
+        except BlockingIOError:
+            pass
+        head    = self.head()
+        while self.tail < head:
+            received_ns , channel , length , data   = SHM_RING_RECORD.unpack_from(
+                    self.buffer             ,
+                    shm_record_offset(
+                        self.tail       ,
+                        self.capacity   ,
+                        )                   ,
+                    )
+            self.tail   += ONE
+            handler(
+                    channel             ,
+                    data[ : length ]    ,
+                    received_ns         ,
+                    )
+        self.write_tail()
+
+
+    def close( self ):
+        """
+            Release the ring, and hang up, so ftposcd stops writing into it
+        """
+        self.buffer.close()
+        close( self.eventfd )
+        self.connection.close()
+
+
+
+class SharedRingServer:
+    """
+        Accept shared rings from ftposcd on a Unix socket at path, and call handler
+        with the ( channel , midi_data , received_ns ) of every message written into
+        any of them, from one thread waiting on every eventfd.
+    """
+
+    def __init__(
+            self    ,
+            path    ,
+            handler ,
+            ):
+        """
+            Listen at path, replacing a socket left by a previous ftposc2midi
+        """
+        self.path       = path
+        self.handler    = handler
+        self.readers    = dict()
+        if exists( path ):
+            remove( path )
+        self.listener   = socket(
+                AF_UNIX     ,
+                SOCK_STREAM ,
+                )
+        self.listener.bind( path )
+        self.listener.listen( SHM_LISTEN_BACKLOG )
+        self.selector   = DefaultSelector()
+        self.selector.register(
+                self.listener   ,
+                EVENT_READ      ,
+                )
+        self.stopped    = Event()
+        self.thread     = Thread(
+                target  = self.serve    ,
+                daemon  = True          ,
+                )
+
+
+    def __enter__( self ):
+        """
+            Start serving
+        """
+        return self.start()
+
+
+    def start( self ):
+        """
+            Start serving
+        """
+        self.thread.start()
+        return self
+
+
+    def __exit__(
+            self        ,
+            *exception  ,
+            ):
+        """
+            Stop serving
+        """
+        return self.close()
+
+
+    def accept( self ):
+        """
+            Accept a ring passed by ftposcd
+        """
+        connection , address    = self.listener.accept()
+        try:
+            hello , fds , flags , address   = recv_fds(
+                    connection      ,
+                    SHM_HELLO_SIZE  ,
+                    SHM_RING_FDS    ,
+                    )
+            if len( fds ) != SHM_RING_FDS:
+                for fd in fds:
+                    close( fd )
+                connection.close()
+                return
+            reader  = SharedRingReader(
+                    connection      ,
+                    hello.decode()  ,
+                    *fds            ,
+                    )
+        except ( OSError , ValueError ) as error:
+            connection.close()
+            print(
+                    error           ,
+                    file = stderr   ,
+                    )
+            return
+        self.readers[ reader.eventfd ]  = reader
+        self.selector.register(
+                reader.eventfd  ,
+                EVENT_READ      ,
+                reader          ,
+                )
+        self.selector.register(
+                connection      ,
+                EVENT_READ      ,
+                reader          ,
+                )
+        try:
+            connection.send( SHM_RING_ACK )
+        except OSError:
+            # ftposcd already hung up, which the selector reports next
+            pass
+        print(
+                shm_ring_connected.format(
+                    name    = reader.name   ,
+                    path    = self.path     ,
+                    )
+                )
+
+
+    def hang_up( self , reader ):
+        """
+            Drop a ring whose ftposcd hung up
+        """
+        self.selector.unregister( reader.eventfd )
+        self.selector.unregister( reader.connection )
+        del self.readers[ reader.eventfd ]
+        reader.close()
+        print(
+                shm_ring_disconnected.format(
+                    name    = reader.name   ,
+                    path    = self.path     ,
+                    )
+                )
+
+
+    def serve( self ):
+        """
+            Wait on the listener, every eventfd, and every connection, until closed
+        """
+        while not self.stopped.is_set():
+            for key , events in self.selector.select():
+                if key.fileobj is self.listener:
+                    if not self.stopped.is_set():
+                        self.accept()
+                elif key.fileobj is key.data.connection:
+                    # ftposcd never sends, so a readable connection has hung up
+                    key.data.drain( self.handler )
+                    self.hang_up( key.data )
+                else:
+                    key.data.drain( self.handler )
+
+
+    def close( self ):
+        """
+            Stop serving, and release every ring
+        """
+        self.stopped.set()
+        if self.thread.is_alive():
+            # Wake the selector
+            with socket(
+                    AF_UNIX     ,
+                    SOCK_STREAM ,
+                    ) as waker:
+                try:
+                    waker.connect( self.path )
+                except OSError:
+                    pass
+                self.thread.join()
+        # Stop listening first, so ftposcd does not reconnect meanwhile
+        self.selector.unregister( self.listener )
+        self.listener.close()
+        if exists( self.path ):
+            remove( self.path )
+        for reader in list( self.readers.values() ):
+            self.selector.unregister( reader.eventfd )
+            self.selector.unregister( reader.connection )
+            reader.close()
+        self.readers.clear()
+        self.selector.close()
@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    Transport Module
+        ftp.transport
+
+    Written By:
+        Shane Hutter
+
+        A module for the transports OSC is sent over between ftposcd and ftposc2midi,
+        chosen by a URL in the configuration file:
+            udp://host:port     a UDP datagram per packet (default, and host:port)
+            unix:///path        a Unix datagram socket, skipping the network stack
+                                when both daemons run on the same host
+            tcp://host:port     a persistent TCP connection, with each packet SLIP
+                                framed as in OSC 1.1, for lossy links such as Wi-Fi
+
+        ftposc2midi serves every transport with liblo, which detects SLIP framing on
+        TCP streams, see FTP.osc.osc_server_address().  liblo is not imported here, so
+        FTP.config can parse OSC URLs without it.
+"""
+
+from .      import (
+        ZERO    , ONE   ,
+        )
+from errno      import (
+        EINPROGRESS , EISCONN   ,
+        )
+from socket     import (
+        getaddrinfo , socket        ,
+        AF_UNIX     , IPPROTO_TCP   , SOCK_DGRAM    , SOCK_STREAM   ,
+        SOL_SOCKET  , SO_SNDBUF     , TCP_NODELAY   ,
+        )
+
+
+OSC_TRANSPORTS  = {
+        "udp"   : "udp"     ,
+        "unix"  : "unix"    ,
+        "tcp"   : "tcp"     ,
+        }
+OSC_URL_SEPARATOR   = "://"
+OSC_PORT_SEPARATOR  = ":"
+OSC_HOST_BRACKETS   = "[]"
+
+# Transports which are a stream of SLIP framed packets, not one datagram per packet
+OSC_STREAM_TRANSPORTS   = (
+        OSC_TRANSPORTS[ "tcp" ] ,
+        )
+
+# SLIP, RFC 1055
+SLIP_END        = b"\xc0"
+SLIP_ESC        = b"\xdb"
+SLIP_ESC_END    = b"\xdb\xdc"
+SLIP_ESC_ESC    = b"\xdb\xdd"
+
+ADDRINFO_INDICES    = {
+        "family"    : 0 ,
+        "address"   : 4 ,
+        }
+
+# A TCP connection is connecting while connect_ex() returns one of these
+TCP_CONNECTING_ERRNOS   = (
+        ZERO        , EINPROGRESS   , EISCONN   ,
+        )
+
+osc_url_unknown = "unknown transport {transport!r} in {url!r}"
+osc_url_format  = "{transport}://{host}:{port}"
+osc_path_url_format = "{transport}://{host}"
+
+
+
+def osc_url(
+        url             ,
+        osc_port = ZERO ,
+        ):
+    """
+        Return the ( host , port , transport ) of an OSC URL.
+
+        A URL without a transport, such as host:port, is UDP.  osc_port is used when
+        the URL has no port.  The host of a unix:// URL is the path of the socket,
+        with port 0.  Raise ValueError for an unknown transport, or port.
+    """
+    transport , separator , address = url.partition( OSC_URL_SEPARATOR )
+    if not separator:
+        transport , address = OSC_TRANSPORTS[ "udp" ] , url
+    if transport not in OSC_TRANSPORTS:
+        raise ValueError(
+                osc_url_unknown.format(
+                    transport   = transport ,
+                    url         = url       ,
+                    )
+                )
+    if transport == OSC_TRANSPORTS[ "unix" ]:
+        return (
+                address     ,
+                ZERO        ,
+                transport   ,
+                )
+    osc_host , separator , port = address.rpartition( OSC_PORT_SEPARATOR )
+    if not separator or address.endswith( OSC_HOST_BRACKETS[ ONE ] ):
+        # No port, or only a bracketed IPv6 address
+        osc_host , port = address , osc_port
+    return (
+            osc_host.strip( OSC_HOST_BRACKETS ) ,
+            int( port )                         ,
+            transport                           ,
+            )
+
+
+def osc_target_name(
+        osc_host    ,
+        osc_port    ,
+        transport   ,
+        ):
+    """
+        Return the name of an OSC target in reports and metrics: host:port for UDP,
+        the URL of any other transport.
+    """
+    if transport == OSC_TRANSPORTS[ "udp" ]:
+        return "{}{}{}".format(
+                osc_host            ,
+                OSC_PORT_SEPARATOR  ,
+                osc_port            ,
+                )
+    if transport == OSC_TRANSPORTS[ "unix" ]:
+        return osc_path_url_format.format(
+                transport   = transport ,
+                host        = osc_host  ,
+                )
+    return osc_url_format.format(
+            transport   = transport ,
+            host        = osc_host  ,
+            port        = osc_port  ,
+            )
+
+
+def slip_encode( osc_packet ):
+    """
+        Frame an encoded OSC packet with SLIP, with an END byte on both sides as OSC
+        1.1 recommends, so a receiver resynchronises after a partial packet.
+    """
+    return SLIP_END + bytes( osc_packet ).replace(
+            SLIP_ESC        ,
+            SLIP_ESC_ESC    ,
+            ).replace(
+                    SLIP_END        ,
+                    SLIP_ESC_END    ,
+                    ) + SLIP_END
+
+
+def slip_decode( stream ):
+    """
+        Split a bytes stream of SLIP frames into its packets.
+
+        Return a list of the complete packets, and the bytes of the partial packet
+        which follows them.
+    """
+    *frames , partial   = stream.split( SLIP_END )
+    return [
+            frame.replace(
+                SLIP_ESC_END    ,
+                SLIP_END        ,
+                ).replace(
+                        SLIP_ESC_ESC    ,
+                        SLIP_ESC        ,
+                        )
+            for frame in frames
+            if frame
+            ] , partial
+
+
+def osc_address_info(
+        osc_host    ,
+        osc_port    ,
+        socket_type ,
+        ):
+    """
+        Return the ( family , address ) of the first address of an OSC target
+    """
+    address_info    = getaddrinfo(
+            osc_host            ,
+            osc_port            ,
+            type = socket_type  ,
+            )[ ZERO ]
+    return (
+            address_info[ ADDRINFO_INDICES[ "family" ] ]    ,
+            address_info[ ADDRINFO_INDICES[ "address" ] ]   ,
+            )
+
+
+def set_sndbuf(
+        osc_socket  ,
+        osc_sndbuf  ,
+        ):
+    """
+        Set SO_SNDBUF on a socket, 0 keeps the system default
+    """
+    if osc_sndbuf:
+        osc_socket.setsockopt(
+                SOL_SOCKET  ,
+                SO_SNDBUF   ,
+                osc_sndbuf  ,
+                )
+    return osc_socket
+
+
+def udp_socket(
+        osc_host        ,
+        osc_port        ,
+        osc_sndbuf = 0  ,
+        ):
+    """
+        Open a non-blocking UDP socket, connected to the OSC target.
+
+        osc_sndbuf sets SO_SNDBUF on the socket, 0 keeps the system default.
+    """
+    family , address    = osc_address_info(
+            osc_host    ,
+            osc_port    ,
+            SOCK_DGRAM  ,
+            )
+    osc_socket      = set_sndbuf(
+            socket(
+                family      ,
+                SOCK_DGRAM  ,
+                )           ,
+            osc_sndbuf      ,
+            )
+    osc_socket.setblocking( False )
+    osc_socket.connect( address )
+    return osc_socket
+
+
+def unix_socket(
+        osc_path        ,
+        osc_port = 0    ,
+        osc_sndbuf = 0  ,
+        ):
+    """
+        Open a non-blocking Unix datagram socket, connected to the socket at osc_path.
+
+        osc_port is ignored.  osc_sndbuf sets SO_SNDBUF on the socket.
+    """
+    osc_socket  = set_sndbuf(
+            socket(
+                AF_UNIX     ,
+                SOCK_DGRAM  ,
+                )           ,
+            osc_sndbuf      ,
+            )
+    osc_socket.setblocking( False )
+    osc_socket.connect( osc_path )
+    return osc_socket
+
+
+def tcp_socket(
+        osc_host        ,
+        osc_port        ,
+        osc_sndbuf = 0  ,
+        ):
+    """
+        Open a non-blocking TCP socket, and start connecting it to the OSC target.
+
+        The connection is not waited for, so an unreachable target never blocks the
+        caller.  Sends fail, and are counted, until it is connected.  Nagle's algorithm
+        is disabled, so every packet is sent as soon as it is written.
+    """
+    family , address    = osc_address_info(
+            osc_host    ,
+            osc_port    ,
+            SOCK_STREAM ,
+            )
+    osc_socket  = set_sndbuf(
+            socket(
+                family      ,
+                SOCK_STREAM ,
+                )           ,
+            osc_sndbuf      ,
+            )
+    osc_socket.setsockopt(
+            IPPROTO_TCP ,
+            TCP_NODELAY ,
+            ONE         ,
+            )
+    osc_socket.setblocking( False )
+    error   = osc_socket.connect_ex( address )
+    if error not in TCP_CONNECTING_ERRNOS:
+        osc_socket.close()
+        raise ConnectionError(
+                error                                       ,
+                "connecting to {}".format( address )        ,
+                )
+    return osc_socket
+
+
+OSC_TRANSPORT_SOCKETS   = {
+        OSC_TRANSPORTS[ "udp" ]     : udp_socket    ,
+        OSC_TRANSPORTS[ "unix" ]    : unix_socket   ,
+        OSC_TRANSPORTS[ "tcp" ]     : tcp_socket    ,
+        }
+
+
+def osc_socket(
+        osc_host                                ,
+        osc_port                                ,
+        transport   = OSC_TRANSPORTS[ "udp" ]   ,
+        osc_sndbuf  = 0                         ,
+        ):
+    """
+        Open a non-blocking socket to an OSC target, over its transport
+    """
+    return OSC_TRANSPORT_SOCKETS[ transport ](
+            osc_host    ,
+            osc_port    ,
+            osc_sndbuf  ,
+            )
@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    benchmarks package __init__
+
+    Written By:
+        Shane Hutter
+
+        Shared helpers for the benchmark suite.  Benchmarks run without a Fishman
+        Triple Play connected, using synthetic mido messages and a local UDP sink.
+
+        Each benchmark is measured for time per operation (ns/op), and memory
+        allocated per operation with tracemalloc:
+            retained    bytes still allocated after the operation, per operation
+            peak        bytes allocated at once while running one operation
+
+        Results are saved as JSON, and can be compared with a previous run, so
+        regressions between versions are visible.
+"""
+
+from FTP        import (
+        PROG_VERSION    ,
+        ZERO            , ONE   ,
+        )
+from argparse   import ArgumentParser
+from importlib.machinery    import SourceFileLoader
+from importlib.util         import (
+        module_from_spec    , spec_from_loader  ,
+        )
+from json       import (
+        dump    , load  ,
+        )
+from os.path    import (
+        abspath , dirname   , join  ,
+        )
+from platform   import python_version
+from socket     import (
+        socket  ,
+        AF_INET , SOCK_DGRAM    ,
+        )
+from threading  import Thread
+from time       import perf_counter_ns
+import tracemalloc
+
+
+BENCHMARK_ITERATIONS    = 100000
+BENCHMARK_REPEATS       = 5
+ALLOCATION_ITERATIONS   = 1000
+UDP_SINK_HOST           = "127.0.0.1"
+UDP_SINK_BUFFER         = 65536
+REPO_DIR                = dirname( dirname( abspath( __file__ ) ) )
+
+result_line     = "{name:<40} {ns_per_op:>12.1f} ns/op {retained:>10.1f} B/op retained {peak:>8} B peak"
+compare_line    = "{name:<40} {ns_per_op:>12.1f} ns/op {change:>+8.1f}%"
+
+
+
+def load_script( script ):
+    """
+        Import one of the executables in the repository, which have no .py extension,
+        as a module.  Its main() is not run.
+    """
+    loader  = SourceFileLoader(
+            script                      ,
+            join( REPO_DIR , script )   ,
+            )
+    module  = module_from_spec(
+            spec_from_loader(
+                script  ,
+                loader  ,
+                )
+            )
+    loader.exec_module( module )
+    return module
+
+
+
+class UDPSink:
+    """
+        A local UDP socket which receives, and discards, everything sent to it.
+    """
+
+    def __init__( self ):
+        """
+            Bind to a free port, and start draining the socket
+        """
+        self.socket = socket(
+                AF_INET     ,
+                SOCK_DGRAM  ,
+                )
+        self.socket.bind(
+                ( UDP_SINK_HOST , ZERO , )
+                )
+        self.host , self.port   = self.socket.getsockname()
+        self.buffer     = bytearray( UDP_SINK_BUFFER )
+        self.received   = ZERO
+        Thread(
+                target  = self.drain    ,
+                daemon  = True          ,
+                ).start()
+
+
+    def drain( self ):
+        """
+            Receive and discard datagrams until the socket is closed
+
+            Datagrams are received into one preallocated buffer, so the sink does not
+            show up in the allocations of the benchmark.
+        """
+        try:
+            while True:
+                self.socket.recv_into( self.buffer )
+                self.received   += ONE
+        except OSError:
+            return
+
+
+    def close( self ):
+        self.socket.close()
+
+
+
+def measure(
+        function                            ,
+        iterations  = BENCHMARK_ITERATIONS  ,
+        repeats     = BENCHMARK_REPEATS     ,
+        ):
+    """
+        Measure function, called with no arguments.
+
+        Return a dictionary of the best ns/op over repeats, and the retained and peak
+        bytes allocated per operation.
+    """
+    # Warm up, so caches and free lists are filled before measuring
+    for iteration in range( ALLOCATION_ITERATIONS ):
+        function()
+
+    # Time
+    ns_per_op   = None
+    for repeat in range( repeats ):
+        start_ns    = perf_counter_ns()
+        for iteration in range( iterations ):
+            function()
+        elapsed     = ( perf_counter_ns() - start_ns ) / iterations
+        if ns_per_op is None or elapsed < ns_per_op:
+            ns_per_op   = elapsed
+
+    # Allocations
+    tracemalloc.start()
+    function()
+    before , peak   = tracemalloc.get_traced_memory()
+    for iteration in range( ALLOCATION_ITERATIONS ):
+        function()
+    after , peak    = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    function()
+    current , peak  = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+            "ns_per_op" : ns_per_op                                     ,
+            "retained"  : ( after - before ) / ALLOCATION_ITERATIONS    ,
+            "peak"      : peak - after                                  ,
+            }
+
+
+def benchmark_arguments( description ):
+    """
+        Return the ArgumentParser shared by every benchmark
+    """
+    argument_parser = ArgumentParser( description = description )
+    argument_parser.add_argument(
+            "--iterations"                      ,
+            type    = int                       ,
+            default = BENCHMARK_ITERATIONS      ,
+            help    = "operations per repeat"   ,
+            )
+    argument_parser.add_argument(
+            "--output"                          ,
+            help    = "save results to a JSON file" ,
+            )
+    argument_parser.add_argument(
+            "--compare"                         ,
+            help    = "compare with results from a previous JSON file"  ,
+            )
+    return argument_parser
+
+
+def run_benchmarks(
+        benchmarks  ,
+        arguments   ,
+        ):
+    """
+        Measure every ( name , function ) in benchmarks, print the results, and save
+        or compare them as requested by the benchmark_arguments() arguments.
+    """
+    results = {}
+    for name , function in benchmarks:
+        results[ name ] = measure(
+                function                ,
+                arguments.iterations    ,
+                )
+        print(
+                result_line.format(
+                    name    = name  ,
+                    **results[ name ]
+                    )
+                )
+    return report_results(
+            results     ,
+            arguments   ,
+            )
+
+
+def report_results(
+        results     ,
+        arguments   ,
+        ):
+    """
+        Compare results with, and save them to, the files given by the
+        benchmark_arguments() arguments.  Return the results.
+    """
+    if arguments.compare:
+        with open( arguments.compare , "r" ) as compare_file:
+            previous    = load( compare_file )
+        print(
+                "\nCompared with {version} ({file})".format(
+                    version = previous[ "version" ] ,
+                    file    = arguments.compare     ,
+                    )
+                )
+        for name in results:
+            if name in previous[ "results" ]:
+                print(
+                        compare_line.format(
+                            name        = name                              ,
+                            ns_per_op   = results[ name ][ "ns_per_op" ]    ,
+                            change      = (
+                                results[ name ][ "ns_per_op" ]
+                                / previous[ "results" ][ name ][ "ns_per_op" ]
+                                - ONE
+                                ) * 100                                     ,
+                            )
+                        )
+
+    if arguments.output:
+        with open( arguments.output , "w" ) as output_file:
+            dump(
+                    {
+                        "version"   : PROG_VERSION      ,
+                        "python"    : python_version()  ,
+                        "results"   : results           ,
+                        }       ,
+                    output_file ,
+                    indent = 4  ,
+                    )
+    return results
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    benchmarks.allocations
+
+    Written By:
+        Shane Hutter
+
+        Check that the steady-state OSC encode, and socket send, allocate nothing.
+
+        Each check is warmed up, so caches and free lists are filled, then run for
+        iterations operations under tracemalloc.  The peak of every operation is
+        compared with the memory allocated before it, so an allocation freed before
+        the operation returns is counted too.  Any operation which allocates fails
+        the check, and the exit status is non-zero, so a regression fails a build
+        instead of only showing up as B/op in the hot path benchmark.
+
+        Python allocates every int past 256, so the sender's counters are reset
+        before each operation, outside of what is measured.  The sender sends to a
+        bound socket which is never read, as tracemalloc also traces the thread of
+        a UDPSink.
+
+        Usage:
+            python3 -m benchmarks.allocations [--iterations 100000]
+"""
+
+from benchmarks import (
+        benchmark_arguments , UDP_SINK_HOST ,
+        )
+from benchmarks.hotpath import SYNTHETIC_MESSAGES
+from FTP        import (
+        ZERO    , ONE   ,
+        )
+from FTP.osc    import (
+        osc_output_paths    , OSCMidiEncoder    ,
+        )
+from FTP.sender import SocketSender
+from itertools  import cycle
+from socket     import (
+        socket  , AF_INET   , SOCK_DGRAM    ,
+        )
+from sys        import exit
+import tracemalloc
+
+
+ALLOCATION_WARMUP   = 1000
+
+allocation_line     = "{name:<40} {allocating:>8} of {iterations} ops allocated, at most {largest} B  {result}"
+allocation_failed   = "{failed} allocation check(s) allocated in the steady state"
+
+
+
+def allocating_operations(
+        function            ,
+        iterations          ,
+        prepare     = None  ,
+        ):
+    """
+        Warm up function, then call it iterations times, and return the number of
+        calls which allocated, and the most bytes allocated by one call.
+
+        prepare is called before every call, and is not measured.
+    """
+    for iteration in range( ALLOCATION_WARMUP ):
+        function()
+    allocating  = ZERO
+    largest     = ZERO
+    tracemalloc.start()
+    for iteration in range( iterations ):
+        if prepare:
+            prepare()
+        tracemalloc.reset_peak()
+        before , peak   = tracemalloc.get_traced_memory()
+        function()
+        after , peak    = tracemalloc.get_traced_memory()
+        if peak > before:
+            allocating  += ONE
+            largest     = max(
+                    largest         ,
+                    peak - before   ,
+                    )
+    tracemalloc.stop()
+    return allocating , largest
+
+
+def reset_counters( sender ):
+    """
+        Reset the counters of every target of sender, so counting allocates nothing
+    """
+    for target in sender.targets:
+        target.sent     = ZERO
+        target.dropped  = ZERO
+        target.errors   = ZERO
+
+
+def main():
+    """
+        Run every allocation check, and exit non-zero if any fails
+    """
+    argument_parser = benchmark_arguments(
+            "Check the steady-state OSC encode and send allocate nothing"
+            )
+    arguments   = argument_parser.parse_args()
+    midi_datas  = cycle(
+            [ message.bytes() for message in SYNTHETIC_MESSAGES ]
+            )
+    osc_paths   = osc_output_paths()
+    encoder     = OSCMidiEncoder( osc_paths )
+    sink        = socket(
+            AF_INET     ,
+            SOCK_DGRAM  ,
+            )
+    sink.bind(
+            ( UDP_SINK_HOST , ZERO , )
+            )
+    sender      = SocketSender(
+            osc_paths                   ,
+            [ sink.getsockname() ]      ,
+            )
+    checks      = (
+            (
+                "OSCMidiEncoder.encode"                         ,
+                lambda: encoder.encode( next( midi_datas ) )    ,
+                None                                            ,
+                )   ,
+            (
+                "socket sender send_midi"                       ,
+                lambda: sender.send_midi( next( midi_datas ) )  ,
+                lambda: reset_counters( sender )                ,
+                )   ,
+            )
+    failed  = 0
+    for name , function , prepare in checks:
+        allocating , largest    = allocating_operations(
+                function                ,
+                arguments.iterations    ,
+                prepare                 ,
+                )
+        if allocating:
+            failed  += ONE
+        print(
+                allocation_line.format(
+                    name        = name                              ,
+                    allocating  = allocating                        ,
+                    iterations  = arguments.iterations              ,
+                    largest     = largest                           ,
+                    result      = "FAIL" if allocating else "ok"    ,
+                    )
+                )
+    sender.close()
+    sink.close()
+    if failed:
+        exit(
+                allocation_failed.format( failed = failed )
+                )
+    return
+
+
+
+if __name__ == "__main__":
+    main()
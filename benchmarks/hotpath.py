@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    benchmarks.hotpath
+
+    Written By:
+        Shane Hutter
+
+        Microbenchmarks for every stage a note passes through, from the MIDI bytes
+        recieved by ftposcd, to the MIDI bytes sent by ftposc2midi.
+
+        Usage:
+            python3 -m benchmarks.hotpath [--output results.json] [--compare old.json]
+"""
+
+from benchmarks import (
+        benchmark_arguments , load_script   , run_benchmarks    ,
+        UDPSink             ,
+        )
+from FTP        import ZERO
+from FTP.midi   import (
+        midi_dict   , midi_tuple    , midi_data_tuple   ,
+        FTP_CHANNEL_TO_OUTPORT      , FTPOSC2MIDI_ALL_OUTPORT   ,
+        FTPStringBridge             , FTPStringOutport          ,
+        MIDI_CHANNELS   ,
+        )
+from FTP.osc    import (
+        osc_output_paths    , osc_path          , osc_path_format   ,
+        osc_status_paths    , osc_target        , send_osc_midi     ,
+        OSCMidiEncoder      , OSCPathCache      ,
+        )
+from FTP.coalesce   import MIDICoalescer
+from FTP.device import (
+        FTPDeviceManager    , RawMIDIInput  ,
+        )
+from FTP.metrics    import FTPMetrics
+from FTP.ring   import MIDIRing
+from FTP.sender import OSC_SENDERS
+from itertools  import cycle
+from mido       import Message
+from time       import perf_counter_ns
+from types      import SimpleNamespace
+
+
+# A strummed chord, with some pitch bend, over every string channel
+SYNTHETIC_MESSAGES  = [
+        Message(
+            "note_on"               ,
+            channel     = channel   ,
+            note        = 40 + channel  ,
+            velocity    = 100       ,
+            )
+        for channel in range( MIDI_CHANNELS )
+        ] + [
+        Message(
+            "pitchwheel"            ,
+            channel     = channel   ,
+            pitch       = 512       ,
+            )
+        for channel in range( MIDI_CHANNELS )
+        ] + [
+        Message(
+            "note_off"              ,
+            channel     = channel   ,
+            note        = 40 + channel  ,
+            )
+        for channel in range( MIDI_CHANNELS )
+        ]
+
+
+class NullMidiOut:
+    """
+        An rtmidi MidiOut which discards every message sent to it
+    """
+    def send_message( self , message ):
+        return
+
+
+
+def hotpath_benchmarks( udp_sink ):
+    """
+        Return a list of ( name , function ) for every hot path stage
+    """
+    messages        = cycle( SYNTHETIC_MESSAGES )
+    midi_datas      = cycle(
+            [ message.bytes() for message in SYNTHETIC_MESSAGES ]
+            )
+    osc_midis       = cycle(
+            [ midi_tuple( message ) for message in SYNTHETIC_MESSAGES ]
+            )
+    osc_paths       = osc_output_paths()
+    status_paths    = osc_status_paths( osc_paths )
+    encoder         = OSCMidiEncoder( osc_paths )
+    target          = osc_target(
+            udp_sink.host   ,
+            udp_sink.port   ,
+            )
+    midi_ring       = MIDIRing()
+    metrics         = FTPMetrics( "benchmark" )
+    coalescer       = MIDICoalescer(
+            lambda midi_data , received_ns: None    ,
+            1000                                    ,
+            )
+    device_manager  = FTPDeviceManager()
+    midi_events     = cycle(
+            [ ( message.bytes() , 0.0 , ) for message in SYNTHETIC_MESSAGES ]
+            )
+    # The callback of a RawMIDIInput, without a port open
+    raw_input       = SimpleNamespace(
+            callback    = device_manager.queue.put  ,
+            priority    = ZERO                      ,
+            )
+    osc_path_format.update(
+            direction   = "output"  ,
+            channel     = "0"       ,
+            )
+
+    # ftposc2midi
+    ftposc2midi     = load_script( "ftposc2midi" )
+    all_outport     = FTPStringOutport(
+            FTPOSC2MIDI_ALL_OUTPORT     ,
+            None                        ,
+            midi_out    = NullMidiOut() ,
+            )
+    midi_outports   = tuple(
+            FTPStringOutport(
+                FTP_CHANNEL_TO_OUTPORT.get( channel )   ,
+                midi_out    = NullMidiOut()             ,
+                aggregate   = all_outport               ,
+                )
+            for channel in range( MIDI_CHANNELS )
+            ) + ( all_outport , )
+    osc_outports    = OSCPathCache( midi_outports )
+    midi_bridge     = FTPStringBridge( midi_outports = midi_outports )
+    osc2midi_path   = osc_paths[ 10 ]
+    unknown_path    = "/otherhost/unknown/output/10"
+
+    benchmarks  = [
+            (
+                "rtmidi callback and receive"                   ,
+                lambda: (
+                    RawMIDIInput.receive(
+                        raw_input           ,
+                        next( midi_events ) ,
+                        )                   ,
+                    device_manager.receive(),
+                    )                                           ,
+                )   ,
+            (
+                "mido callback and receive"                     ,
+                lambda: (
+                    device_manager.mido_receive(
+                        Message.from_bytes( next( midi_datas ) )
+                        )                   ,
+                    device_manager.receive(),
+                    )                                           ,
+                )   ,
+            (
+                "midi_dict"                                     ,
+                lambda: midi_dict( next( messages ) )           ,
+                )   ,
+            (
+                "midi_tuple"                                    ,
+                lambda: midi_tuple( next( messages ) )          ,
+                )   ,
+            (
+                "midi_data_tuple"                               ,
+                lambda: midi_data_tuple( next( midi_datas ) )   ,
+                )   ,
+            (
+                "osc_path.format"                               ,
+                lambda: osc_path.format( **osc_path_format )    ,
+                )   ,
+            (
+                "osc_status_paths lookup"                       ,
+                lambda: status_paths[ next( midi_datas )[ 0 ] ] ,
+                )   ,
+            (
+                "OSCMidiEncoder.encode"                         ,
+                lambda: encoder.encode( next( midi_datas ) )    ,
+                )   ,
+            (
+                "MIDIRing put and poll"                         ,
+                lambda: (
+                    midi_ring.put(
+                        next( midi_datas )  ,
+                        0                   ,
+                        )                   ,
+                    midi_ring.poll()        ,
+                    )                                           ,
+                )   ,
+            (
+                "FTPMetrics.record"                             ,
+                lambda: metrics.record(
+                    next( midi_datas )      ,
+                    perf_counter_ns()       ,
+                    )                                           ,
+                )   ,
+            (
+                "MIDICoalescer.add"                             ,
+                lambda: (
+                    coalescer.add(
+                        next( midi_datas )  ,
+                        0                   ,
+                        )                   ,
+                    coalescer.flush_due()   ,
+                    )                                           ,
+                )   ,
+            (
+                "send_osc_midi"                                 ,
+                lambda: send_osc_midi(
+                    target                  ,
+                    osc2midi_path           ,
+                    next( osc_midis )       ,
+                    )                                           ,
+                )   ,
+            ]
+
+    # Every OSC sender
+    senders = list()
+    for sender_name , sender_class in OSC_SENDERS.items():
+        sender  = sender_class(
+                osc_paths                               ,
+                [ ( udp_sink.host , udp_sink.port , ) ] ,
+                )
+        senders.append( sender )
+        benchmarks.append(
+                (
+                    "{} sender send_midi".format( sender_name )         ,
+                    lambda sender = sender: sender.send_midi(
+                        next( midi_datas )
+                        )                                               ,
+                    )
+                )
+
+    benchmarks.append(
+            (
+                "osc2midi_convert"                          ,
+                lambda: ftposc2midi.osc2midi_convert(
+                    osc2midi_path           ,
+                    [ next( osc_midis ) ]   ,
+                    "m"                     ,
+                    None                    ,
+                    osc_outports            ,
+                    )                                       ,
+                )
+            )
+    benchmarks.append(
+            (
+                "osc2midi_convert unknown path"             ,
+                lambda: ftposc2midi.osc2midi_convert(
+                    unknown_path            ,
+                    [ next( osc_midis ) ]   ,
+                    "m"                     ,
+                    None                    ,
+                    osc_outports            ,
+                    )                                       ,
+                )
+            )
+
+    # ftposcd --bridge, in place of send_midi, and osc2midi_convert
+    benchmarks.append(
+            (
+                "FTPStringBridge.send"                      ,
+                lambda: midi_bridge.send( next( midi_datas ) )  ,
+                )
+            )
+    return benchmarks , senders
+
+
+def main():
+    """
+        Run the hot path benchmarks
+    """
+    arguments   = benchmark_arguments(
+            "Microbenchmarks for the MIDI to OSC hot path"
+            ).parse_args()
+    udp_sink    = UDPSink()
+    benchmarks , senders    = hotpath_benchmarks( udp_sink )
+    run_benchmarks(
+            benchmarks  ,
+            arguments   ,
+            )
+    for sender in senders:
+        sender.close()
+    udp_sink.close()
+    return
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    benchmarks.realtime
+
+    Written By:
+        Shane Hutter
+
+        Measure the effect of real-time mode on the latency of the hot path.
+
+        Synthetic phrases are played through the same stages as ftposcd: a mido
+        message is parsed from the recieved bytes, sent by the socket sender to a local
+        UDP sink, and recorded in FTPMetrics.  Each message also leaves a little cyclic
+        garbage, as mido and the rest of a busy process do, so the garbage collector
+        runs while notes are being sent.  Phrases are bursts of notes, with short
+        gaps, and a longer rest between phrases, in which an idle collection can run.
+
+        The phrases are played once as ftposcd runs by default, then again in
+        real-time mode, and the latency percentiles of both are reported.
+
+        Usage:
+            python3 -m benchmarks.realtime [--priority 50] [--cpus 2] [--output results.json]
+"""
+
+from benchmarks import (
+        benchmark_arguments , report_results    ,
+        UDPSink             ,
+        )
+from benchmarks.hotpath import SYNTHETIC_MESSAGES
+from FTP.metrics    import FTPMetrics
+from FTP.osc    import osc_output_paths
+from FTP.realtime   import (
+        gc_freeze   , IdleCollector , realtime_affinity ,
+        realtime_thread             ,
+        )
+from FTP.sender import SocketSender
+from itertools  import cycle
+from mido       import Message
+from time       import (
+        perf_counter_ns , sleep ,
+        )
+import gc
+
+
+REALTIME_MESSAGES   = 50000
+PHRASE_BURSTS       = 32        # bursts per phrase
+BURST_GAP           = .001      # seconds between bursts
+PHRASE_REST         = .05       # seconds between phrases
+IDLE_INTERVAL       = 20        # milliseconds
+NANOSECONDS_PER_MICRO   = 1000
+REALTIME_PERCENTILES    = {
+        "p50"   : 50.0  ,
+        "p99"   : 99.0  ,
+        "p999"  : 99.9  ,
+        }
+
+latency_line    = "{mode:<10} p50 {p50:>8.1f}us p99 {p99:>8.1f}us p99.9 {p999:>8.1f}us max {max:>8.1f}us {collections:>6} gc collections"
+
+
+
+class Garbage:
+    """
+        An object in a reference cycle, only freed by the garbage collector
+    """
+    def __init__( self ):
+        self.cycle  = self
+
+
+
+def play_phrases(
+        sender      ,
+        metrics     ,
+        messages    ,
+        ):
+    """
+        Play messages through the hot path, in bursts of one pass through
+        SYNTHETIC_MESSAGES, recording the latency of each in metrics.
+    """
+    midi_datas  = cycle(
+            [ message.bytes() for message in SYNTHETIC_MESSAGES ]
+            )
+    burst_size  = len( SYNTHETIC_MESSAGES )
+    for index in range( messages ):
+        midi_data   = next( midi_datas )
+        received_ns = perf_counter_ns()
+        midi_data   = Message.from_bytes( midi_data ).bytes()
+        sender.send_midi( midi_data )
+        metrics.record(
+                midi_data   ,
+                received_ns ,
+                )
+        Garbage()
+        if not ( index + 1 ) % burst_size:
+            if not ( index + 1 ) % ( burst_size * PHRASE_BURSTS ):
+                sleep( PHRASE_REST )
+            else:
+                sleep( BURST_GAP )
+
+
+def latency_results(
+        mode        ,
+        metrics     ,
+        collections ,
+        ):
+    """
+        Print, and return, the latency percentiles of a run in microseconds
+    """
+    latency = {
+            name    : metrics.latency.percentile( percentile )
+            for name , percentile in REALTIME_PERCENTILES.items()
+            }
+    latency[ "max" ]    = metrics.latency.maximum_value / NANOSECONDS_PER_MICRO
+    print(
+            latency_line.format(
+                mode        = mode          ,
+                collections = collections   ,
+                **latency
+                )
+            )
+    return latency
+
+
+def main():
+    """
+        Run the hot path by default, then in real-time mode
+    """
+    argument_parser = benchmark_arguments(
+            "Hot path latency, by default and in real-time mode"
+            )
+    argument_parser.set_defaults( iterations = REALTIME_MESSAGES )
+    argument_parser.add_argument(
+            "--priority"                                    ,
+            type    = int                                   ,
+            default = 0                                     ,
+            help    = "SCHED_FIFO priority in real-time mode"   ,
+            )
+    argument_parser.add_argument(
+            "--cpus"                                        ,
+            help    = "CPUs to run on in real-time mode"    ,
+            )
+    arguments   = argument_parser.parse_args()
+    udp_sink    = UDPSink()
+    sender      = SocketSender(
+            osc_output_paths()                  ,
+            [ ( udp_sink.host , udp_sink.port , ) , ]   ,
+            )
+    results     = dict()
+
+    # Default
+    metrics     = FTPMetrics( "default" )
+    collections = sum( stats[ "collections" ] for stats in gc.get_stats() )
+    play_phrases(
+            sender                  ,
+            metrics                 ,
+            arguments.iterations    ,
+            )
+    latency     = latency_results(
+            "default"                                                               ,
+            metrics                                                                 ,
+            sum( stats[ "collections" ] for stats in gc.get_stats() ) - collections ,
+            )
+    results.update(
+            {
+                "default {}".format( name ) : { "ns_per_op" : value * NANOSECONDS_PER_MICRO }
+                for name , value in latency.items()
+                }
+            )
+
+    # Real-time mode
+    if arguments.cpus:
+        realtime_affinity( arguments.cpus )
+    if arguments.priority:
+        realtime_thread(
+                arguments.priority  ,
+                report  = True      ,
+                )
+    metrics     = FTPMetrics( "realtime" )
+    gc_freeze()
+    idle_collector  = IdleCollector(
+            lambda: metrics.latency.count   ,
+            IDLE_INTERVAL                   ,
+            ).start()
+    play_phrases(
+            sender                  ,
+            metrics                 ,
+            arguments.iterations    ,
+            )
+    idle_collector.stop()
+    latency     = latency_results(
+            "realtime"                  ,
+            metrics                     ,
+            idle_collector.collections  ,
+            )
+    results.update(
+            {
+                "realtime {}".format( name ) : { "ns_per_op" : value * NANOSECONDS_PER_MICRO }
+                for name , value in latency.items()
+                }
+            )
+
+    report_results(
+            results     ,
+            arguments   ,
+            )
+    sender.close()
+    udp_sink.close()
+    return
+
+
+
+if __name__ == "__main__":
+    main()
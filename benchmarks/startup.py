@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    benchmarks.startup
+
+    Written By:
+        Shane Hutter
+
+        Measure how long ftposcd takes to start, so a restart after a crash gets back
+        to playing as fast as possible.
+
+        ftposcd is run as systemd would run it, with NOTIFY_SOCKET set, replaying a
+        short capture instead of a Tripleplay, and timed from starting the process to
+        the READY=1 notification.  The Python interpreter, and the imports of ftposcd,
+        are timed on their own, to show where the time goes.
+
+        Usage:
+            python3 -m benchmarks.startup [--output results.json] [--compare old.json]
+"""
+
+from benchmarks import (
+        benchmark_arguments , report_results    ,
+        REPO_DIR            , UDPSink           ,
+        )
+from FTP        import ZERO
+from FTP.capture    import MIDICapture
+from FTP.notify import (
+        NOTIFY_SOCKET   , SD_NOTIFY ,
+        )
+from mido       import Message
+from os         import environ
+from os.path    import join
+from shutil     import copyfile
+from socket     import (
+        socket  ,
+        AF_INET , AF_UNIX   , SOCK_DGRAM    ,
+        )
+from subprocess import (
+        DEVNULL , Popen ,
+        )
+from sys        import executable
+from tempfile   import TemporaryDirectory
+from time       import perf_counter_ns
+
+
+STARTUP_ITERATIONS  = 10
+STARTUP_TIMEOUT     = 30
+NOTIFY_BUFFER       = 4096
+NANOSECONDS_PER_MILLI   = 1000000
+
+# Import every module ftposcd imports, without running it
+IMPORT_FTPOSCD  = """
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec , spec_from_loader
+loader = SourceFileLoader( "ftposcd" , {script!r} )
+loader.exec_module( module_from_spec( spec_from_loader( "ftposcd" , loader ) ) )
+"""
+
+startup_line    = "{name:<40} {best:>10.1f} ms best {mean:>10.1f} ms mean"
+
+
+
+def free_port():
+    """
+        Return a UDP port no one is listening on
+    """
+    with socket(
+            AF_INET     ,
+            SOCK_DGRAM  ,
+            ) as port_socket:
+        port_socket.bind(
+                ( "127.0.0.1" , ZERO , )
+                )
+        return port_socket.getsockname()[ 1 ]
+
+
+def time_process(
+        command             ,
+        notify_socket = None,
+        ):
+    """
+        Run command, and return the nanoseconds until it exits, or until it notifies
+        notify_socket it is ready.
+    """
+    environment = dict( environ )
+    if notify_socket:
+        environment[ NOTIFY_SOCKET ]    = notify_socket.getsockname()
+    start_ns    = perf_counter_ns()
+    process     = Popen(
+            command                 ,
+            cwd     = REPO_DIR      ,
+            env     = environment   ,
+            stdout  = DEVNULL       ,
+            )
+    if notify_socket:
+        while SD_NOTIFY[ "ready" ] not in notify_socket.recv(
+                NOTIFY_BUFFER
+                ).decode().split():
+            continue
+        elapsed = perf_counter_ns() - start_ns
+        process.wait( STARTUP_TIMEOUT )
+        return elapsed
+    process.wait( STARTUP_TIMEOUT )
+    return perf_counter_ns() - start_ns
+
+
+def startup_benchmarks(
+        temporary_dir   ,
+        udp_sink        ,
+        ):
+    """
+        Return a list of ( name , command , notify ) for every startup measurement
+    """
+    script  = join(
+            REPO_DIR    ,
+            "ftposcd"   ,
+            )
+
+    # A capture of one chord to replay
+    capture_path    = join(
+            temporary_dir       ,
+            "startup.capture"   ,
+            )
+    midi_capture    = MIDICapture( capture_path )
+    for note in ( 40 , 45 , 50 , 55 , 59 , 64 , ):
+        midi_capture.record(
+                Message(
+                    "note_on"       ,
+                    note    = note  ,
+                    ).bytes()           ,
+                perf_counter_ns()       ,
+                )
+    midi_capture.close()
+
+    # The repository configuration, sending to the UDP sink.  Later lines win.
+    config_path     = join(
+            temporary_dir   ,
+            "ftposcd.conf"  ,
+            )
+    copyfile(
+            join(
+                REPO_DIR        ,
+                "ftposcd.conf"  ,
+                )               ,
+            config_path         ,
+            )
+    with open( config_path , "a" ) as config_file:
+        config_file.write(
+                "\nremote-osc-host {host}\nremote-osc-port {port}\nlocal-osc-port {local}\nmetrics-port 0\n".format(
+                    host    = udp_sink.host ,
+                    port    = udp_sink.port ,
+                    local   = free_port()   ,
+                    )
+                )
+
+    return [
+            (
+                "python interpreter"            ,
+                [ executable , "-c" , "pass" , ],
+                False                           ,
+                )   ,
+            (
+                "ftposcd imports"               ,
+                [
+                    executable                                  ,
+                    "-c"                                        ,
+                    IMPORT_FTPOSCD.format( script = script )    ,
+                    ]                           ,
+                False                           ,
+                )   ,
+            (
+                "ftposcd start to ready"        ,
+                [
+                    executable      ,
+                    script          ,
+                    "--config"      , config_path   ,
+                    "--replay"      , capture_path  ,
+                    "--speed"       , "0"           ,
+                    ]                           ,
+                True                            ,
+                )   ,
+            ]
+
+
+def main():
+    """
+        Run the startup benchmarks
+    """
+    argument_parser = benchmark_arguments(
+            "Startup time of ftposcd, to READY=1"
+            )
+    argument_parser.set_defaults( iterations = STARTUP_ITERATIONS )
+    arguments   = argument_parser.parse_args()
+    udp_sink    = UDPSink()
+    results     = dict()
+    with TemporaryDirectory() as temporary_dir , socket(
+            AF_UNIX     ,
+            SOCK_DGRAM  ,
+            ) as notify_socket:
+        notify_socket.bind(
+                join(
+                    temporary_dir   ,
+                    "notify"        ,
+                    )
+                )
+        notify_socket.settimeout( STARTUP_TIMEOUT )
+        for name , command , notify in startup_benchmarks(
+                temporary_dir   ,
+                udp_sink        ,
+                ):
+            times   = [
+                    time_process(
+                        command                             ,
+                        notify_socket if notify else None   ,
+                        )
+                    for iteration in range( arguments.iterations )
+                    ]
+            results[ name ] = {
+                    "ns_per_op" : min( times )                  ,
+                    "mean"      : sum( times ) / len( times )   ,
+                    }
+            print(
+                    startup_line.format(
+                        name    = name                                              ,
+                        best    = results[ name ][ "ns_per_op" ] / NANOSECONDS_PER_MILLI ,
+                        mean    = results[ name ][ "mean" ] / NANOSECONDS_PER_MILLI ,
+                        )
+                    )
+    report_results(
+            results     ,
+            arguments   ,
+            )
+    udp_sink.close()
+    return
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+"""
+Fishman Tripleplay MIDI to OSC converter
+    benchmarks.transport
+
+    Written By:
+        Shane Hutter
+
+        Compare the latency of the OSC transports between ftposcd and ftposc2midi on
+        one host.
+
+        For each transport, synthetic MIDI messages are sent one at a time by the
+        socket sender, to a liblo OSCServer serving that transport as ftposc2midi
+        does, and timed from send_midi() until the OSC Midi method is called.
+
+        The shared memory ring is timed the same way, from SharedMIDIRing.put() until
+        the SharedRingServer handler is called.
+
+        Usage:
+            python3 -m benchmarks.transport [--iterations 5000] [--output results.json]
+"""
+
+from benchmarks import (
+        benchmark_arguments , report_results    ,
+        )
+from benchmarks.hotpath import SYNTHETIC_MESSAGES
+from benchmarks.startup import free_port
+from FTP        import (
+        ZERO    , ONE   ,
+        )
+from FTP.osc    import (
+        osc_output_paths    , OSCServer     , osc_server_address    ,
+        OSC_TYPETAGS        ,
+        )
+from FTP.sender import SocketSender
+from FTP.shm    import (
+        SharedMIDIRing  , SharedRingServer  ,
+        )
+from FTP.transport  import osc_url
+from itertools  import cycle
+from os.path    import join
+from tempfile   import TemporaryDirectory
+from threading  import Event
+from time       import (
+        perf_counter_ns , sleep ,
+        )
+
+
+TRANSPORT_ITERATIONS    = 5000
+TRANSPORT_TIMEOUT       = 1         # seconds to wait for a message before counting it lost
+TRANSPORT_CONNECT_WAIT  = .1        # seconds for a TCP connection to be accepted
+TRANSPORT_URLS          = {
+        "udp"   : "udp://127.0.0.1:{port}"  ,
+        "unix"  : "unix://{path}"           ,
+        "tcp"   : "tcp://127.0.0.1:{port}"  ,
+        "shm"   : "{path}"                  ,
+        }
+TRANSPORT_PERCENTILES   = {
+        "p50"   : 50.0  ,
+        "p99"   : 99.0  ,
+        }
+NANOSECONDS_PER_MICRO   = 1000
+
+transport_line  = "{transport:<10} p50 {p50:>8.1f}us p99 {p99:>8.1f}us {lost:>6} lost"
+
+
+
+def percentile(
+        latencies   ,
+        percent     ,
+        ):
+    """
+        Return the percentile of a sorted list of latencies
+    """
+    return latencies[
+            min(
+                int( len( latencies ) * percent / 100 ) ,
+                len( latencies ) - ONE                  ,
+                )
+            ]
+
+
+def time_transport(
+        url         ,
+        iterations  ,
+        ):
+    """
+        Send iterations messages over the transport of url, one at a time, and return
+        a sorted list of their latencies in nanoseconds, and the count of lost messages.
+    """
+    received    = Event()
+
+    def osc_midi_received(
+            path        ,
+            args        ,
+            typespec    ,
+            source      ,
+            ):
+        received.set()
+
+    osc_server_port , osc_server_proto  = osc_server_address(
+            url     ,
+            ZERO    ,
+            )
+    latencies   = list()
+    lost        = ZERO
+    midi_datas  = cycle(
+            [ message.bytes() for message in SYNTHETIC_MESSAGES ]
+            )
+    with OSCServer(
+            osc_server_port     ,
+            osc_server_proto    ,
+            ) as osc_server:
+        osc_server.add_method(
+                None                    ,
+                OSC_TYPETAGS[ "midi" ]  ,
+                osc_midi_received       ,
+                )
+        sender  = SocketSender(
+                osc_output_paths()      ,
+                [ osc_url( url ) , ]    ,
+                )
+        sleep( TRANSPORT_CONNECT_WAIT )
+        for iteration in range( iterations ):
+            received.clear()
+            start_ns    = perf_counter_ns()
+            sender.send_midi( next( midi_datas ) )
+            if received.wait( TRANSPORT_TIMEOUT ):
+                latencies.append( perf_counter_ns() - start_ns )
+            else:
+                lost    += ONE
+        sender.close()
+    return sorted( latencies ) , lost
+
+
+def time_shm(
+        path        ,
+        iterations  ,
+        ):
+    """
+        Put iterations messages into a shared memory ring passed over the socket at
+        path, one at a time, and return a sorted list of their latencies in
+        nanoseconds, and the count of lost messages.
+    """
+    received    = Event()
+
+    def shm_received(
+            channel     ,
+            midi_data   ,
+            received_ns ,
+            ):
+        received.set()
+
+    latencies   = list()
+    lost        = ZERO
+    midi_datas  = cycle(
+            [ message.bytes() for message in SYNTHETIC_MESSAGES ]
+            )
+    with SharedRingServer(
+            path            ,
+            shm_received    ,
+            ) , SharedMIDIRing(
+                    path            ,
+                    "benchmark"     ,
+                    ) as shared_ring:
+        while not shared_ring.connected:
+            sleep( TRANSPORT_CONNECT_WAIT )
+        for iteration in range( iterations ):
+            received.clear()
+            start_ns    = perf_counter_ns()
+            shared_ring.put(
+                    next( midi_datas )  ,
+                    start_ns            ,
+                    )
+            if received.wait( TRANSPORT_TIMEOUT ):
+                latencies.append( perf_counter_ns() - start_ns )
+            else:
+                lost    += ONE
+    return sorted( latencies ) , lost
+
+
+def main():
+    """
+        Time every transport
+    """
+    argument_parser = benchmark_arguments(
+            "Latency of each OSC transport, from ftposcd to ftposc2midi"
+            )
+    argument_parser.set_defaults( iterations = TRANSPORT_ITERATIONS )
+    arguments   = argument_parser.parse_args()
+    results     = dict()
+    with TemporaryDirectory() as temporary_dir:
+        for transport , url in TRANSPORT_URLS.items():
+            path    = join(
+                    temporary_dir   ,
+                    "osc.sock"      ,
+                    )
+            if transport == "shm":
+                latencies , lost    = time_shm(
+                        path                    ,
+                        arguments.iterations    ,
+                        )
+            else:
+                latencies , lost    = time_transport(
+                        url.format(
+                            port    = free_port()   ,
+                            path    = path          ,
+                            )                       ,
+                        arguments.iterations        ,
+                        )
+            latency = {
+                    name    : percentile(
+                        latencies   ,
+                        percent     ,
+                        ) / NANOSECONDS_PER_MICRO
+                    for name , percent in TRANSPORT_PERCENTILES.items()
+                    }
+            print(
+                    transport_line.format(
+                        transport   = transport ,
+                        lost        = lost      ,
+                        **latency
+                        )
+                    )
+            results.update(
+                    {
+                        "{} {}".format(
+                            transport   ,
+                            name        ,
+                            ) : { "ns_per_op" : value * NANOSECONDS_PER_MICRO }
+                        for name , value in latency.items()
+                        }
+                    )
+    report_results(
+            results     ,
+            arguments   ,
+            )
+    return
+
+
+
+if __name__ == "__main__":
+    main()
@@ -12,9 +12,11 @@ Fishman Tripleplay MIDI to OSC converter
 
 from distutils.core     import setup
 from FTP                import (
-        PROG_NAME           , PROG_VERSION          , PROG_AUTHOR   ,
-        PROG_AUTHOR_EMAIL   , PROG_DESC             , PROG_PACKAGES ,
-        PATH                , PROG_EXECUTABLES      ,
+        PROG_NAME           , PROG_VERSION          ,
+        )
+from FTP.install        import (
+        PROG_AUTHOR         , PROG_AUTHOR_EMAIL     , PROG_DESC     ,
+        PROG_PACKAGES       , PATH                  , PROG_EXECUTABLES      ,
         SYSTEMD_UNIT_DIR    , SYSTEMD_SERVICE_UNIT  ,
         )
 from FTP.config         import (